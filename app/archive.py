@@ -0,0 +1,147 @@
+# app/archive.py
+import os
+import asyncio
+import secrets
+import datetime
+
+from sqlalchemy import select, func, insert, delete, update, literal
+
+from app.database import async_session, User, RaffleEntry, ArchivedRaffle, ArchivedEntry
+from app.outbox import enqueue
+
+# rows moved per transaction; small batches keep SQLite's write lock short
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "5000"))
+
+
+async def close_raffle(title: str | None = None) -> ArchivedRaffle | None:
+    """
+    Close the current raffle: every ticket sold so far moves from
+    raffle_entries to archived_entries, one batch per transaction, and a
+    summary row is kept in archived_raffles. Tickets bought while this runs
+    stay in the hot table for the next raffle. Returns None if there were no tickets.
+    """
+    async with async_session() as s:
+        pending = (await s.execute(
+            select(ArchivedRaffle).where(ArchivedRaffle.status == "archiving")
+        )).scalar_one_or_none()
+        if pending:
+            # an earlier close-out was interrupted; finish that one first
+            raffle = pending
+        else:
+            first_id, last_id = (await s.execute(
+                select(func.min(RaffleEntry.id), func.max(RaffleEntry.id))
+            )).one()
+            if last_id is None:
+                return None
+            raffle = ArchivedRaffle(title=title, first_ticket_id=first_id, last_ticket_id=last_id)
+            s.add(raffle)
+            await s.commit()
+
+    cols = [RaffleEntry.id, RaffleEntry.user_id, RaffleEntry.payment_ref,
+            RaffleEntry.free_ticket, RaffleEntry.created_at]
+    while True:
+        async with async_session() as s:
+            ids = (await s.execute(
+                select(RaffleEntry.id)
+                .where(RaffleEntry.id <= raffle.last_ticket_id)
+                .order_by(RaffleEntry.id)
+                .limit(ARCHIVE_BATCH)
+            )).scalars().all()
+            if not ids:
+                break
+            lo, hi = ids[0], ids[-1]
+            batch = (RaffleEntry.id >= lo) & (RaffleEntry.id <= hi)
+            await s.execute(
+                insert(ArchivedEntry).from_select(
+                    ["ticket_id", "user_id", "payment_ref", "free_ticket", "created_at", "raffle_id"],
+                    select(*cols, literal(raffle.id)).where(batch),
+                )
+            )
+            await s.execute(delete(RaffleEntry).where(batch))
+            await s.commit()
+        # let handlers and webhooks get at the DB between batches
+        await asyncio.sleep(0)
+
+    async with async_session() as s:
+        total, free, players = (await s.execute(
+            select(
+                func.count(ArchivedEntry.id),
+                func.count(ArchivedEntry.id).filter(ArchivedEntry.free_ticket == True),
+                func.count(func.distinct(ArchivedEntry.user_id)),
+            ).where(ArchivedEntry.raffle_id == raffle.id)
+        )).one()
+        await s.execute(
+            update(ArchivedRaffle)
+            .where(ArchivedRaffle.id == raffle.id)
+            .values(status="archived", ticket_count=total, free_count=free,
+                    player_count=players, archived_at=datetime.datetime.utcnow())
+        )
+        await s.commit()
+        return await s.get(ArchivedRaffle, raffle.id, populate_existing=True)
+
+
+async def draw_winner(raffle_id: int) -> ArchivedRaffle:
+    """
+    Pick the winning ticket of an archived raffle, once: a random offset
+    into its tickets, read through the (raffle_id, ...) index. Re-running
+    returns the recorded winner.
+    """
+    async with async_session() as s:
+        raffle = await s.get(ArchivedRaffle, raffle_id)
+        if raffle.winner_ticket_id is None and raffle.ticket_count:
+            ticket_id, user_id = (await s.execute(
+                select(ArchivedEntry.ticket_id, ArchivedEntry.user_id)
+                .where(ArchivedEntry.raffle_id == raffle_id)
+                .order_by(ArchivedEntry.id)
+                .offset(secrets.randbelow(raffle.ticket_count))
+                .limit(1)
+            )).one()
+            raffle.winner_ticket_id = ticket_id
+            raffle.winner_user_id = user_id
+            raffle.drawn_at = datetime.datetime.utcnow()
+            await s.commit()
+        return raffle
+
+
+async def queue_results(session, raffle: ArchivedRaffle, after_user_id: int, limit: int,
+                        not_before: datetime.datetime | None = None) -> int | None:
+    """
+    Queue the result message for up to `limit` ticket holders with
+    user_id > after_user_id, in the caller's transaction. Returns the last
+    user_id handled, or None once every holder has been queued.
+    """
+    q = await session.execute(
+        select(ArchivedEntry.user_id, User.telegram_id, func.count(ArchivedEntry.id))
+        .join(User, User.id == ArchivedEntry.user_id)
+        .where(ArchivedEntry.raffle_id == raffle.id, ArchivedEntry.user_id > after_user_id)
+        .group_by(ArchivedEntry.user_id, User.telegram_id)
+        .order_by(ArchivedEntry.user_id)
+        .limit(limit)
+    )
+    rows = q.all()
+    if not rows:
+        return None
+
+    name = raffle.title or f"Raffle #{raffle.id}"
+    for user_id, telegram_id, tickets in rows:
+        if user_id == raffle.winner_user_id:
+            text = (f"🎉 <b>Congratulations!</b> Your ticket #{raffle.winner_ticket_id} "
+                    f"won <b>{name}</b>! We'll be in touch about your prize.")
+        else:
+            text = (f"🏁 <b>{name}</b> has been drawn. You had {tickets} ticket(s); "
+                    f"the winning ticket was #{raffle.winner_ticket_id}. Better luck next time!")
+        enqueue(session, telegram_id, text, not_before)
+    return rows[-1][0]
+
+
+async def user_history(session, user_id: int, limit: int = 10) -> list[tuple[ArchivedRaffle, int]]:
+    """(archived raffle, tickets the user had in it), newest first."""
+    q = await session.execute(
+        select(ArchivedRaffle, func.count(ArchivedEntry.id))
+        .join(ArchivedEntry, ArchivedEntry.raffle_id == ArchivedRaffle.id)
+        .where(ArchivedEntry.user_id == user_id)
+        .group_by(ArchivedRaffle.id)
+        .order_by(ArchivedRaffle.id.desc())
+        .limit(limit)
+    )
+    return q.all()
@@ -1,8 +1,13 @@
 # app/bot.py
 import os
+import re
+import time
+import hmac
+import hashlib
+import datetime
+import asyncio
 import logging
 import random
-import aiohttp
 import uvicorn
 
 from fastapi import FastAPI, Request, HTTPException, Response
@@ -15,14 +20,37 @@ from aiogram.types import (
     Message,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
+    InlineQuery,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
     CallbackQuery,
     BotCommand,
+    FSInputFile,
 )
 
-from sqlalchemy import select, func
+from sqlalchemy import select, func, insert
 
 # your own DB utilities / models
-from app.database import async_session, init_db, User, RaffleEntry
+from app.database import async_session, init_db, User, RaffleEntry, Payment, ArchivedRaffle
+from app.utils import TICKET_PRICE, kobo, generate_reference, spawn
+from app.throttle import ThrottleMiddleware, RecentIds
+from app.ticket_index import ticket_index, TICKET_INDEX_ENABLED
+from app.ticket_summary import ticket_summaries, render as render_summary
+from app import rollups
+from app.dashboard import router as dashboard_router
+from app.leaderboard import referral_ranking
+from app.archive import close_raffle, user_history, draw_winner, queue_results
+from app.breaker import ProviderError
+from app.providers import router as payment_router, verification_queue, FLW_SECRET_KEY
+from app.outbox import outbox, enqueue
+from app.scheduler import scheduler
+from app import jsoncodec
+from app.export import (
+    router as export_router, iter_export, gzip_stream, StreamInputFile, export_filename,
+    DATASETS, FORMATS,
+)
+from app.profiling import router as profiling_router, profiler
+from app.logconfig import setup_logging, stop_logging, dropped_records, LogContextMiddleware
 
 
 # ---------------------------------------------------------
@@ -36,26 +64,49 @@ PORT = int(os.getenv("PORT", "8080"))
 # Public base URL of your deployed app, e.g. https://megawinraffle.up.railway.app
 PUBLIC_URL = os.getenv("PUBLIC_URL")
 TELEGRAM_WEBHOOK_PATH = "/webhook/telegram"
+# Sent back by Telegram in X-Telegram-Bot-Api-Secret-Token on every webhook call.
+# Defaults to a value derived from the token so all workers agree on it.
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET") or (
+    hashlib.sha256(f"webhook:{BOT_TOKEN}".encode()).hexdigest() if BOT_TOKEN else None
+)
+# Real updates are a few KB; anything bigger is not from Telegram
+MAX_UPDATE_BYTES = int(os.getenv("MAX_UPDATE_BYTES", str(256 * 1024)))
 PAYSTACK_WEBHOOK_PATH = "/webhook/paystack"
+FLUTTERWAVE_WEBHOOK_PATH = "/webhook/flutterwave"
+# Flutterwave sends this back in the verif-hash header (set it in their dashboard)
+FLW_WEBHOOK_HASH = os.getenv("FLW_WEBHOOK_HASH")
+
+# How long (seconds) an unpaid payment link is handed out again instead of
+# initializing a new transaction.
+PAY_LINK_TTL = int(os.getenv("PAY_LINK_TTL", "900"))
+# Upper bound for /buy N so one payment can't create an absurd number of rows
+MAX_TICKETS_PER_ORDER = int(os.getenv("MAX_TICKETS_PER_ORDER", "100"))
+# /ticket lists this many of the newest tickets under the summary
+TICKET_LIST_LIMIT = int(os.getenv("TICKET_LIST_LIMIT", "20"))
+# how long Telegram may reuse a user's inline "my tickets" answer (it can't be invalidated)
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "60"))
+# Draw results: holders queued per transaction, and how fast those messages are
+# released to the outbox (kept under its ~25/s so payment confirmations still get through)
+NOTIFY_BATCH = int(os.getenv("NOTIFY_BATCH", "100"))
+NOTIFY_RATE = float(os.getenv("NOTIFY_RATE", "20"))  # messages / second
 
 if not BOT_TOKEN:
     raise RuntimeError("❌ BOT_TOKEN not set in environment")
 
-if not PUBLIC_URL:
-    # We can still boot; just won't set Telegram webhook.
-    logging.warning("⚠️ PUBLIC_URL not set. Telegram webhook will NOT be configured.")
-
 
 # ---------------------------------------------------------
 # LOGGING
 # ---------------------------------------------------------
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
-)
+# records go through a queue to a writer thread, so a slow stdout never
+# stalls the event loop; see app/logconfig.py for LOG_* settings
+setup_logging()
 logger = logging.getLogger(__name__)
 logger.info("✅ Environment loaded")
 
+if not PUBLIC_URL:
+    # We can still boot; just won't set Telegram webhook.
+    logger.warning("⚠️ PUBLIC_URL not set. Telegram webhook will NOT be configured.")
+
 
 # ---------------------------------------------------------
 # BOT / DISPATCHER / FASTAPI
@@ -66,6 +117,18 @@ bot = Bot(
 )
 dp = Dispatcher()
 app = FastAPI()
+app.include_router(export_router)
+app.include_router(profiling_router)
+app.include_router(dashboard_router)
+
+# tag log records with the update being handled (first, so throttle drops are tagged too)
+dp.update.outer_middleware(LogContextMiddleware())
+# anti-flood: per-user / per-command token buckets in front of every handler
+throttle = ThrottleMiddleware(exempt={ADMIN_ID})
+dp.update.outer_middleware(throttle)
+
+# /profile and POST /admin/profile trace this bot; idle until a window is opened
+profiler.attach(bot, dp)
 
 
 # ---------------------------------------------------------
@@ -85,18 +148,143 @@ async def get_or_create_user(telegram_id: int, username: str | None = None) -> U
 
         user = User(telegram_id=telegram_id, username=username)
         session.add(user)
+        await rollups.bump(session, new_users=1)
         await session.commit()
         await session.refresh(user)
         return user
 
 
+# (tg_id, quantity) -> (created_at monotonic, reference, checkout url, provider label)
+_pay_links: dict[tuple[int, int], tuple[float, str, str, str]] = {}
+# (tg_id, quantity) -> in-flight checkout initialization shared by concurrent /buy calls
+_pay_inits: dict[tuple[int, int], asyncio.Task] = {}
+
+
+def _cache_pay_link(key: tuple[int, int], ref: str, pay_url: str, label: str):
+    now = time.monotonic()
+    if len(_pay_links) >= 10_000:
+        # drop expired links so the cache can't grow without bound
+        for k in [k for k, v in _pay_links.items() if now - v[0] >= PAY_LINK_TTL]:
+            del _pay_links[k]
+    _pay_links[key] = (now, ref, pay_url, label)
+
+
+def forget_pay_link(tg_id: int, quantity: int = 1):
+    """Stop reusing a user's link (e.g. once it has been paid)."""
+    _pay_links.pop((tg_id, quantity), None)
+
+
+async def _init_payment(user: User, quantity: int) -> tuple[str, str, str]:
+    """Start a checkout for `quantity` tickets with the best provider and record it as pending."""
+    tg_id = user.telegram_id
+    ref = generate_reference()
+    amount = kobo(TICKET_PRICE) * quantity
+    callback_url = f"{PUBLIC_URL}{PAYSTACK_WEBHOOK_PATH}" if PUBLIC_URL else None
+
+    # raises ProviderError when no provider could start the checkout
+    provider, pay_url = await payment_router.initialize(ref, amount, tg_id, quantity, callback_url)
+
+    # tickets are only created by the webhook once the payment succeeds
+    async with async_session() as s:
+        s.add(Payment(user_id=user.id, provider=provider.name, reference=ref,
+                      quantity=quantity, amount=amount))
+        await rollups.bump(s, checkouts=1)
+        await s.commit()
+
+    _cache_pay_link((tg_id, quantity), ref, pay_url, provider.label)
+    return ref, pay_url, provider.label
+
+
+async def get_payment_link(user: User, quantity: int = 1) -> tuple[str, str, str]:
+    """
+    Return (reference, checkout url, provider label) for `quantity` tickets.
+    Reuses an unpaid link from the last PAY_LINK_TTL seconds, and concurrent
+    calls for the same user share a single initialization.
+    """
+    key = (user.telegram_id, quantity)
+    cached = _pay_links.get(key)
+    if cached and time.monotonic() - cached[0] < PAY_LINK_TTL:
+        # the payment may have been credited on another worker; one lookup by the unique reference
+        async with async_session() as s:
+            status = await s.scalar(select(Payment.status).where(Payment.reference == cached[1]))
+        if status == "pending":
+            return cached[1], cached[2], cached[3]
+        forget_pay_link(*key)
+
+    task = _pay_inits.get(key)
+    if task is None:
+        task = asyncio.create_task(_init_payment(user, quantity))
+        _pay_inits[key] = task
+        task.add_done_callback(lambda _: _pay_inits.pop(key, None))
+    # shield: one waiter being cancelled must not cancel it for the others
+    return await asyncio.shield(task)
+
+
+async def run_close_job(job):
+    """
+    Scheduled close_raffle job: sales are already refused (scheduler.sales_closed);
+    archive the raffle, draw the winner, then queue every holder's result.
+    Each step checkpoints job.payload, so a retry resumes where it stopped.
+    """
+    p = job.payload
+    if "raffle_id" not in p:
+        if "after_raffle" not in p:
+            async with async_session() as s:
+                p["after_raffle"] = await s.scalar(select(func.max(ArchivedRaffle.id))) or 0
+            await job.checkpoint()
+        async with async_session() as s:
+            # a previous attempt may have finished archiving before it died;
+            # closing again would archive the next raffle's tickets
+            raffle = await s.scalar(
+                select(ArchivedRaffle).where(ArchivedRaffle.id > p["after_raffle"],
+                                             ArchivedRaffle.status == "archived")
+                .order_by(ArchivedRaffle.id).limit(1)
+            )
+        if raffle is None:
+            raffle = await close_raffle(p.get("title"))
+            ticket_summaries.clear()
+            if ticket_index.loaded:
+                async with async_session() as s:
+                    await ticket_index.load(s)
+        p["raffle_id"] = raffle.id if raffle else None
+        await job.checkpoint()
+
+    if p["raffle_id"] is None:
+        async with async_session() as s:
+            enqueue(s, ADMIN_ID, "📭 Scheduled close: no tickets were sold, nothing to draw.")
+            await s.commit()
+        outbox.notify()
+        return
+
+    raffle = await draw_winner(p["raffle_id"])
+    cursor = p.get("cursor", 0)
+    send_at = max(p.get("send_at", 0), time.time())
+    while cursor is not None:
+        async with async_session() as s:
+            cursor = await queue_results(s, raffle, cursor, NOTIFY_BATCH,
+                                         datetime.datetime.utcfromtimestamp(send_at))
+            if cursor is None:
+                winner = await s.get(User, raffle.winner_user_id) if raffle.winner_user_id else None
+                who = f"@{winner.username}" if winner and winner.username else \
+                    str(getattr(winner, "telegram_id", "nobody"))
+                enqueue(s, ADMIN_ID,
+                        f"🏆 <b>{raffle.title or f'Raffle #{raffle.id}'}</b> drawn automatically\n"
+                        f"Winner: {who} (ticket #{raffle.winner_ticket_id})\n"
+                        f"🎟 {raffle.ticket_count} tickets, 👥 {raffle.player_count} players notified")
+            send_at += NOTIFY_BATCH / NOTIFY_RATE
+            p["cursor"], p["send_at"] = cursor, send_at
+            await job.checkpoint(s)  # commits the queued messages with the new cursor
+        outbox.notify()
+
+
 async def set_bot_commands():
     cmds = [
         BotCommand(command="start", description="Start / Referral link"),
         BotCommand(command="help", description="How to use the bot"),
-        BotCommand(command="buy", description="Buy a raffle ticket (₦500)"),
+        BotCommand(command="buy", description=f"Buy raffle tickets (₦{TICKET_PRICE} each)"),
         BotCommand(command="ticket", description="View your tickets"),
         BotCommand(command="referrals", description="Your referral count"),
+        BotCommand(command="leaderboard", description="Top referrers"),
     ]
     await bot.set_my_commands(cmds)
 
@@ -116,7 +304,8 @@ async def cmd_start(message: Message, command: Command):
     if args:
         try:
             ref_tg_id = int(args)
-            if ref_tg_id != tg_id:
+            # each user can be credited to a referrer only once
+            if ref_tg_id != tg_id and user.referred_by is None:
                 async with async_session() as s:
                     q = await s.execute(select(User).where(User.telegram_id == ref_tg_id))
                     ref_user = q.scalar_one_or_none()
@@ -124,23 +313,34 @@ async def cmd_start(message: Message, command: Command):
                         # ensure the field exists (some DBs might be older)
                         current = getattr(ref_user, "referral_count", 0) or 0
                         ref_user.referral_count = current + 1
+                        old_total = ref_user.referral_total or 0
+                        ref_user.referral_total = old_total + 1
                         s.add(ref_user)
 
+                        me_q = await s.execute(select(User).where(User.id == user.id))
+                        me_q.scalar_one().referred_by = ref_tg_id
+                        user.referred_by = ref_tg_id
+
                         # 5 referrals => 1 free ticket
-                        if ref_user.referral_count >= 5:
+                        award = ref_user.referral_count >= 5
+                        await rollups.bump(s, referred_users=1, tickets_free=int(award))
+                        if award:
                             entry = RaffleEntry(user_id=ref_user.id, free_ticket=True)
                             s.add(entry)
                             ref_user.referral_count -= 5
+                            enqueue(
+                                s, ref_user.telegram_id,
+                                "🎉 <b>You referred 5 users and earned a FREE ticket!</b>",
+                            )
                             await s.commit()
-                            try:
-                                await bot.send_message(
-                                    ref_user.telegram_id,
-                                    "🎉 <b>You referred 5 users and earned a FREE ticket!</b>",
-                                )
-                            except Exception as e:
-                                logger.warning(f"Failed to notify referrer: {e}")
+                            outbox.notify()
+                            ticket_summaries.invalidate(ref_user.telegram_id)
+                            if ticket_index.loaded:
+                                ticket_index.add(entry.id, ref_user.id, free=True)
                         else:
                             await s.commit()
+                        if referral_ranking.loaded:
+                            referral_ranking.bump(old_total, ref_user.referral_total)
         except ValueError:
             pass
 
@@ -149,6 +349,7 @@ async def cmd_start(message: Message, command: Command):
 
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🎟 Buy Ticket", callback_data="buy_ticket")],
+        [InlineKeyboardButton(text=f"🎟 x{n}", callback_data=f"buy_qty:{n}") for n in (5, 10, 20)],
         [InlineKeyboardButton(text="🎫 My Tickets", callback_data="view_tickets")],
         [InlineKeyboardButton(text="👥 Referrals", callback_data="my_referrals")],
         [InlineKeyboardButton(text="❓ Help", callback_data="help_cmd")],
@@ -167,95 +368,163 @@ async def cmd_start(message: Message, command: Command):
 async def cmd_help(message: Message):
     await message.answer(
         "💡 <b>How to play</b>\n"
-        "• /buy — Buy a raffle ticket (₦500)\n"
-        "• /ticket — View your tickets\n"
-        "• /referrals — See your referral count\n\n"
+        f"• /buy — Buy a raffle ticket (₦{TICKET_PRICE})\n"
+        "• /buy N — Buy N tickets in one payment\n"
+        "• /ticket — View your tickets (/ticket history for past raffles)\n"
+        "• /referrals — See your referral count\n"
+        "• /leaderboard — Top referrers\n\n"
         "<b>Admin only</b>:\n"
         "• /winners — pick a random winner\n"
-        "• /stats — view platform stats"
+        "• /stats — view platform stats\n"
+        "• /closeraffle [title] — archive this raffle's tickets and start a new one\n"
+        "• /schedule close YYYY-MM-DD HH:MM [title] — close, draw and notify automatically (UTC)\n"
+        "• /export [entries|payments] [csv|ndjson] — download the ledger\n"
+        "• /profile [seconds] [sample rate] — trace live traffic"
     )
 
 
 @dp.message(Command("buy"))
-async def cmd_buy(message: Message):
-    """Initialize Paystack transaction and reply with payment link."""
-    if not PAYSTACK_SECRET_KEY:
-        await message.answer("❌ Paystack key not set.")
+async def cmd_buy(message: Message, command: Command | None = None):
+    """ /buy [N] — start a checkout and reply with the payment link."""
+    args = (command.args or "").strip() if command else ""
+    quantity = 1
+    if args:
+        try:
+            quantity = int(args)
+        except ValueError:
+            quantity = 0
+        if not 1 <= quantity <= MAX_TICKETS_PER_ORDER:
+            await message.answer(f"❌ Usage: /buy N  (1–{MAX_TICKETS_PER_ORDER} tickets)")
+            return
+    await send_payment_link(message, message.from_user, quantity)
+
+
+async def send_payment_link(message: Message, from_user: types.User, quantity: int = 1):
+    if not PAYSTACK_SECRET_KEY and not FLW_SECRET_KEY:
+        await message.answer("❌ No payment provider configured.")
         return
 
-    tg_id = message.from_user.id
-    username = message.from_user.username
-    user = await get_or_create_user(tg_id, username)
+    if scheduler.sales_closed:
+        await message.answer("🔒 Ticket sales are closed while the draw runs. Check back shortly!")
+        return
 
-    callback_url = f"{PUBLIC_URL}{PAYSTACK_WEBHOOK_PATH}" if PUBLIC_URL else None
+    unavailable = "⚠️ Payments are temporarily unavailable. Please try again in a few minutes."
+    if not payment_router.available and (from_user.id, quantity) not in _pay_links:
+        # don't make the user wait on providers we know are down
+        await message.answer(unavailable)
+        return
 
-    async with aiohttp.ClientSession() as s:
-        headers = {"Authorization": f"Bearer {PAYSTACK_SECRET_KEY}",
-                   "Content-Type": "application/json"}
-        payload = {
-            "email": f"user_{tg_id}@megawinraffle.com",
-            "amount": 500 * 100,  # kobo
-            "metadata": {"telegram_id": tg_id},
-            "callback_url": callback_url,  # optional; webhook does server-to-server
-        }
-        async with s.post("https://api.paystack.co/transaction/initialize",
-                          headers=headers, json=payload) as resp:
-            res = await resp.json()
-
-    if res.get("status"):
-        ref = res["data"]["reference"]
-        pay_url = res["data"]["authorization_url"]
-
-        # store a placeholder entry with payment_ref so webhook can match it
-        async with async_session() as s:
-            s.add(RaffleEntry(user_id=user.id, payment_ref=ref, free_ticket=False))
-            await s.commit()
+    user = await get_or_create_user(from_user.id, from_user.username)
+    try:
+        _, pay_url, label = await get_payment_link(user, quantity)
+    except ProviderError as e:
+        logger.warning("Could not start checkout: %s", e)
+        await message.answer(unavailable)
+        return
 
-        await message.answer(
-            "💳 <b>Payment</b>\n\n"
-            "Click below to complete your payment:\n"
-            f"👉 <a href=\"{pay_url}\">Pay ₦500 via Paystack</a>\n\n"
-            "Once payment is confirmed, your raffle ticket will be added automatically. ✅",
-            disable_web_page_preview=True,
-        )
-    else:
-        await message.answer("❌ Could not start Paystack payment. Please try again.")
+    what = "your raffle ticket" if quantity == 1 else f"your {quantity} raffle tickets"
+    await message.answer(
+        "💳 <b>Payment</b>\n\n"
+        "Click below to complete your payment:\n"
+        f"👉 <a href=\"{pay_url}\">Pay ₦{TICKET_PRICE * quantity:,} via {label}</a>\n\n"
+        f"Once payment is confirmed, {what} will be added automatically. ✅",
+        disable_web_page_preview=True,
+    )
 
 
 @dp.message(Command("ticket"))
-async def cmd_ticket(message: Message):
-    tg_id = message.from_user.id
+async def cmd_ticket(message: Message, command: Command | None = None):
+    """ /ticket [history] — current tickets, or past raffles from the archive."""
+    want_history = bool(command and (command.args or "").strip().lower() == "history")
+    if want_history:
+        await send_ticket_history(message, message.from_user.id)
+    else:
+        await send_tickets(message, message.from_user.id)
+
+
+async def send_tickets(message: Message, tg_id: int, full: bool = True):
+    """Cached summary on top; `full` adds the newest TICKET_LIST_LIMIT tickets."""
     async with async_session() as s:
-        q = await s.execute(select(User).where(User.telegram_id == tg_id))
-        user = q.scalar_one_or_none()
-        if not user:
+        summary = await ticket_summaries.get(s, tg_id)
+        if summary is None:
             await message.answer("🚫 You don't have any tickets yet.")
             return
-
-        q2 = await s.execute(select(RaffleEntry).where(RaffleEntry.user_id == user.id))
-        tickets = q2.scalars().all()
-        if not tickets:
+        if not summary.tickets:
             await message.answer("🚫 You have no tickets yet. Use /buy.")
             return
+        text = render_summary(summary, await ticket_summaries.total(s))
+        if not full:
+            await message.answer(text + "\n\nSend /ticket for the list.")
+            return
 
-        parts = []
-        for t in tickets:
-            kind = "Free" if getattr(t, "free_ticket", False) else "Paid"
-            when = getattr(t, "created_at", None)
+        q = await s.execute(
+            select(RaffleEntry.id, RaffleEntry.free_ticket, RaffleEntry.created_at)
+            .join(User, User.id == RaffleEntry.user_id)
+            .where(User.telegram_id == tg_id)
+            .order_by(RaffleEntry.id.desc())
+            .limit(TICKET_LIST_LIMIT)
+        )
+        parts = [text, ""]
+        for ticket_id, free, when in q.all():
+            kind = "Free" if free else "Paid"
             when_txt = when.strftime("%Y-%m-%d %H:%M") if when else "-"
-            parts.append(f"🎫 #{t.id} | {kind} | {when_txt}")
+            parts.append(f"🎫 #{ticket_id} | {kind} | {when_txt}")
+        if summary.tickets > TICKET_LIST_LIMIT:
+            parts.append(f"…and {summary.tickets - TICKET_LIST_LIMIT} older")
+
+    await message.answer("\n".join(parts))
 
-        await message.answer("\n".join(parts))
+
+async def send_ticket_history(message: Message, tg_id: int):
+    async with async_session() as s:
+        q = await s.execute(select(User).where(User.telegram_id == tg_id))
+        user = q.scalar_one_or_none()
+        past = await user_history(s, user.id) if user else []
+    if not past:
+        await message.answer("📭 No tickets in past raffles.")
+        return
+    lines = ["📜 <b>Past raffles</b>"]
+    for raffle, n in past:
+        name = raffle.title or f"Raffle #{raffle.id}"
+        when = raffle.closed_at.strftime("%Y-%m-%d") if raffle.closed_at else "-"
+        lines.append(f"🎫 {name} ({when}): {n} ticket(s) of {raffle.ticket_count}")
+    await message.answer("\n".join(lines))
 
 
 @dp.message(Command("referrals"))
 async def cmd_referrals(message: Message):
-    tg_id = message.from_user.id
+    await send_referrals(message, message.from_user.id)
+
+
+async def send_referrals(message: Message, tg_id: int):
     async with async_session() as s:
         q = await s.execute(select(User).where(User.telegram_id == tg_id))
         user = q.scalar_one_or_none()
-        count = getattr(user, "referral_count", 0) if user else 0
-        await message.answer(f"👥 You have referred <b>{count}</b> user(s).")
+        total = (user.referral_total or 0) if user else 0
+        progress = (user.referral_count or 0) if user else 0
+        await referral_ranking.refresh(s)
+
+    lines = [
+        f"👥 You have referred <b>{total}</b> user(s).",
+        f"🎁 {progress}/5 towards your next free ticket.",
+    ]
+    position = referral_ranking.rank(total) if referral_ranking.loaded else None
+    if position:
+        lines.append(f"🏅 You are <b>#{position}</b> on the leaderboard (/leaderboard).")
+    await message.answer("\n".join(lines))
+
+
+@dp.message(Command("leaderboard"))
+async def cmd_leaderboard(message: Message):
+    async with async_session() as s:
+        top = await referral_ranking.top(s)
+    if not top:
+        await message.answer("🏆 No referrals yet — be the first! Use /start to get your link.")
+        return
+
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+    rows = [f"{medals.get(i, f'{i}.')} {who} — {n}" for i, (who, n) in enumerate(top, start=1)]
+    await message.answer("🏆 <b>Top referrers</b>\n" + "\n".join(rows))
 
 
 @dp.message(Command("winners"))
@@ -265,17 +534,28 @@ async def cmd_winners(message: Message):
         return
 
     async with async_session() as s:
-        q = await s.execute(select(RaffleEntry))
-        entries = q.scalars().all()
-        if not entries:
+        if ticket_index.loaded:
+            if await ticket_index.sync(s):
+                logger.info("Ticket index was stale; reloaded (%d tickets)", len(ticket_index))
+            drawn = ticket_index.draw()
+        else:
+            # pick by offset rather than loading every ticket
+            total = await s.scalar(select(func.count(RaffleEntry.id)))
+            drawn = None
+            if total:
+                drawn = tuple((await s.execute(
+                    select(RaffleEntry.id, RaffleEntry.user_id)
+                    .order_by(RaffleEntry.id).offset(random.randrange(total)).limit(1)
+                )).one())
+        if not drawn:
             await message.answer("📭 No tickets yet.")
             return
 
-        winner = random.choice(entries)
-        q2 = await s.execute(select(User).where(User.id == winner.user_id))
+        ticket_id, user_id = drawn
+        q2 = await s.execute(select(User).where(User.id == user_id))
         user = q2.scalar_one_or_none()
         who = f"@{user.username}" if user and user.username else str(getattr(user, "telegram_id", "unknown"))
-        await message.answer(f"🏆 <b>Winner:</b> {who}\n🎫 Ticket #{winner.id}")
+        await message.answer(f"🏆 <b>Winner:</b> {who}\n🎫 Ticket #{ticket_id}")
 
 
 @dp.message(Command("stats"))
@@ -286,33 +566,197 @@ async def cmd_stats(message: Message):
 
     async with async_session() as s:
         total_users = await s.scalar(select(func.count(User.id)))
-        total_tickets = await s.scalar(select(func.count(RaffleEntry.id)))
-        total_free = await s.scalar(select(func.count(RaffleEntry.id)).where(RaffleEntry.free_ticket == True))
+        if ticket_index.loaded:
+            total_tickets, total_free = len(ticket_index), ticket_index.free_count
+        else:
+            total_tickets = await s.scalar(select(func.count(RaffleEntry.id)))
+            total_free = await s.scalar(select(func.count(RaffleEntry.id)).where(RaffleEntry.free_ticket == True))
 
     await message.answer(
         "📊 <b>Stats</b>\n"
         f"👥 Users: {total_users or 0}\n"
         f"🎟 Tickets: {total_tickets or 0}\n"
-        f"🆓 Free: {total_free or 0}"
+        f"🆓 Free: {total_free or 0}\n"
+        f"🚦 Throttled: {sum(v for k, v in throttle.stats.items() if k.startswith('dropped_'))}\n"
+        f"🪵 Log lines dropped: {dropped_records()}"
+    )
+
+
+@dp.message(Command("closeraffle"))
+async def cmd_closeraffle(message: Message, command: Command | None = None):
+    """Admin: move the current raffle's tickets to the archive (draw with /winners first)."""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("🚫 Only admin can run this command.")
+        return
+
+    title = ((command.args or "").strip() if command else "") or None
+    await message.answer("⏳ Archiving current raffle…")
+    raffle = await close_raffle(title)
+    if not raffle:
+        await message.answer("📭 No tickets to archive.")
+        return
+
+    ticket_summaries.clear()
+    if ticket_index.loaded:
+        async with async_session() as s:
+            await ticket_index.load(s)
+
+    await message.answer(
+        f"🗄 <b>{raffle.title or f'Raffle #{raffle.id}'}</b> archived\n"
+        f"🎟 Tickets: {raffle.ticket_count} (free: {raffle.free_count})\n"
+        f"👥 Players: {raffle.player_count}\n"
+        "A new raffle starts now."
     )
 
 
+@dp.message(Command("schedule"))
+async def cmd_schedule(message: Message, command: Command | None = None):
+    """Admin: /schedule | /schedule close YYYY-MM-DD HH:MM [title] | /schedule cancel ID"""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("🚫 Only admin can run this command.")
+        return
+
+    args = ((command.args or "") if command else "").split(maxsplit=3)
+    if not args:
+        jobs = await scheduler.upcoming()
+        if not jobs:
+            await message.answer("🗓 Nothing scheduled.")
+            return
+        lines = [f"#{j.id} {j.kind} at {j.run_at:%Y-%m-%d %H:%M} UTC ({j.status})" for j in jobs]
+        await message.answer("🗓 <b>Scheduled</b>\n" + "\n".join(lines))
+        return
+
+    if args[0] == "cancel" and len(args) > 1 and args[1].lstrip("#").isdigit():
+        ok = await scheduler.cancel(int(args[1].lstrip("#")))
+        await message.answer("✅ Cancelled." if ok else "⚠️ No pending job with that id (already started?).")
+        return
+
+    if args[0] == "close" and len(args) >= 3:
+        try:
+            run_at = datetime.datetime.strptime(f"{args[1]} {args[2]}", "%Y-%m-%d %H:%M")
+        except ValueError:
+            run_at = None
+        if run_at:
+            title = args[3] if len(args) > 3 else None
+            job_id = await scheduler.schedule("close_raffle", run_at, {"title": title})
+            await message.answer(
+                f"🗓 Job #{job_id}: sales close at {run_at:%Y-%m-%d %H:%M} UTC, "
+                "then the draw runs and every ticket holder is notified."
+            )
+            return
+
+    await message.answer("Usage: /schedule close YYYY-MM-DD HH:MM [title] · /schedule cancel ID")
+
+
+@dp.message(Command("export"))
+async def cmd_export(message: Message, command: Command | None = None):
+    """Admin: /export [entries|payments] [csv|ndjson] — gzipped ledger as a document."""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("🚫 Only admin can run this command.")
+        return
+
+    args = ((command.args or "") if command else "").split()
+    dataset = next((a for a in args if a in DATASETS), "entries")
+    fmt = next((a for a in args if a in FORMATS), "csv")
+
+    async def upload():
+        doc = StreamInputFile(
+            gzip_stream(iter_export(dataset, fmt)),
+            filename=export_filename(dataset, fmt) + ".gz",
+        )
+        try:
+            await bot.send_document(message.chat.id, doc, caption=f"📦 {dataset} export")
+        except Exception as e:
+            logger.error("Export upload failed: %s", e)
+            await bot.send_message(
+                message.chat.id,
+                "❌ Export upload failed (Telegram caps documents at 50 MB).\n"
+                f"Use <code>GET /admin/export?dataset={dataset}&amp;format={fmt}</code> instead.",
+            )
+
+    # uploads can take a while; don't hold the webhook request open for it
+    spawn(upload(), name="export-upload")
+    await message.answer(f"⏳ Preparing {dataset} export ({fmt}, gzipped)…")
+
+
+@dp.message(Command("profile"))
+async def cmd_profile(message: Message, command: Command | None = None):
+    """Admin: /profile [seconds] [rate] — trace a sample of live updates, then send the trace."""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("🚫 Only admin can run this command.")
+        return
+    if profiler.active:
+        await message.answer("⏳ A profiling window is already running.")
+        return
+
+    args = ((command.args or "") if command else "").split()
+    try:
+        seconds = int(args[0]) if args else 30
+        rate = float(args[1]) if len(args) > 1 else 0.1
+    except ValueError:
+        await message.answer("Usage: /profile [seconds] [sample rate 0-1]")
+        return
+
+    async def capture():
+        try:
+            path = await profiler.run(seconds, rate)
+            await bot.send_document(message.chat.id, FSInputFile(path),
+                                    caption="🔬 Trace (open in ui.perfetto.dev)")
+        except Exception as e:
+            logger.error("Profiling failed: %s", e)
+            await bot.send_message(message.chat.id, f"❌ Profiling failed: {e}")
+
+    spawn(capture(), name="profile")
+    await message.answer(f"🔬 Tracing {rate:.0%} of updates for {seconds}s…")
+
+
+@dp.message(Command("checkindex"))
+async def cmd_checkindex(message: Message):
+    """Admin: compare the in-memory ticket index with the DB, reload on mismatch."""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("🚫 Only admin can run this command.")
+        return
+    if not ticket_index.loaded:
+        await message.answer("ℹ️ Ticket index is disabled (set TICKET_INDEX=1).")
+        return
+
+    async with async_session() as s:
+        if await ticket_index.verify(s):
+            await message.answer(f"✅ Ticket index consistent ({len(ticket_index)} tickets).")
+            return
+        await ticket_index.load(s)
+    logger.warning("Ticket index was out of sync with the DB and has been reloaded")
+    await message.answer(f"⚠️ Index was out of sync; reloaded ({len(ticket_index)} tickets).")
+
+
 # ---------------------------------------------------------
 # CALLBACKS
 # ---------------------------------------------------------
 @dp.callback_query(F.data == "buy_ticket")
 async def cb_buy(callback: CallbackQuery):
-    await cmd_buy(callback.message)
+    # callback.message is the bot's own message; buy for whoever tapped
+    await send_payment_link(callback.message, callback.from_user)
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith("buy_qty:"))
+async def cb_buy_qty(callback: CallbackQuery):
+    try:
+        quantity = int(callback.data.split(":", 1)[1])
+    except ValueError:
+        quantity = 0
+    if 1 <= quantity <= MAX_TICKETS_PER_ORDER:
+        await send_payment_link(callback.message, callback.from_user, quantity)
     await callback.answer()
 
 @dp.callback_query(F.data == "view_tickets")
 async def cb_tickets(callback: CallbackQuery):
-    await cmd_ticket(callback.message)
+    # callback.message is the bot's own message; show the tapper's tickets
+    await send_tickets(callback.message, callback.from_user.id, full=False)
     await callback.answer()
 
 @dp.callback_query(F.data == "my_referrals")
 async def cb_ref(callback: CallbackQuery):
-    await cmd_referrals(callback.message)
+    await send_referrals(callback.message, callback.from_user.id)
     await callback.answer()
 
 @dp.callback_query(F.data == "help_cmd")
@@ -321,6 +765,34 @@ async def cb_help(callback: CallbackQuery):
     await callback.answer()
 
 
+# ---------------------------------------------------------
+# INLINE MODE (enable with /setinline in @BotFather)
+# ---------------------------------------------------------
+@dp.inline_query()
+async def inline_my_tickets(query: InlineQuery):
+    """@bot in any chat: the user's ticket summary, from the same cache as /ticket."""
+    async with async_session() as s:
+        summary = await ticket_summaries.get(s, query.from_user.id)
+        if summary and summary.tickets:
+            total = await ticket_summaries.total(s)
+            text = render_summary(summary, total)
+            description = f"{summary.tickets} ticket(s) · {summary.tickets / max(total, 1):.2%} odds"
+        else:
+            text = "🎟 No raffle tickets yet. Open the bot and send /buy to get one!"
+            description = "No tickets yet"
+
+    await query.answer(
+        [InlineQueryResultArticle(
+            id="my_tickets",
+            title="🎫 My tickets",
+            description=description,
+            input_message_content=InputTextMessageContent(message_text=text),
+        )],
+        cache_time=INLINE_CACHE_TIME,
+        is_personal=True,
+    )
+
+
 # ---------------------------------------------------------
 # WEBHOOK ROUTES
 # ---------------------------------------------------------
@@ -328,13 +800,13 @@ async def cb_help(callback: CallbackQuery):
 async def paystack_webhook(request: Request):
     """Handle Paystack -> server webhook and add/confirm tickets."""
     try:
-        payload = await request.json()
+        payload = jsoncodec.loads(await request.body())
     except Exception:
         raise HTTPException(status_code=400, detail="invalid json")
 
     event = payload.get("event")
     data = payload.get("data", {})
-    logger.info(f"📩 Paystack event: {event}")
+    logger.info("📩 Paystack event: %s", event, extra={"sample": True})
 
     if event != "charge.success" or data.get("status") != "success":
         return {"status": "ignored"}
@@ -344,56 +816,206 @@ async def paystack_webhook(request: Request):
     if not tg_id or not reference:
         raise HTTPException(status_code=400, detail="missing telegram_id or reference")
 
-    # verify reference with Paystack
-    async with aiohttp.ClientSession() as s:
-        headers = {"Authorization": f"Bearer {PAYSTACK_SECRET_KEY}"}
-        url = f"https://api.paystack.co/transaction/verify/{reference}"
-        async with s.get(url, headers=headers) as resp:
-            v = await resp.json()
+    return await verify_and_credit("paystack", tg_id, reference)
+
+
+@app.post(FLUTTERWAVE_WEBHOOK_PATH)
+async def flutterwave_webhook(request: Request):
+    """Handle Flutterwave -> server webhook; same crediting pipeline as Paystack."""
+    if FLW_WEBHOOK_HASH and not hmac.compare_digest(request.headers.get("verif-hash", "").encode(),
+                                                    FLW_WEBHOOK_HASH.encode()):
+        raise HTTPException(status_code=401, detail="invalid signature")
+    try:
+        payload = jsoncodec.loads(await request.body())
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid json")
+
+    data = payload.get("data") or payload
+    logger.info("📩 Flutterwave event: %s", payload.get("event"), extra={"sample": True})
+    if data.get("status") not in ("successful", "success"):
+        return {"status": "ignored"}
+
+    reference = data.get("tx_ref") or data.get("txRef") or data.get("reference")
+    meta = data.get("meta") or payload.get("meta_data") or {}
+    tg_id = meta.get("telegram_id")
+    if reference and not tg_id:
+        # not every Flutterwave event echoes meta; fall back to our checkout record
+        async with async_session() as s:
+            tg_id = await s.scalar(
+                select(User.telegram_id).join(Payment, Payment.user_id == User.id)
+                .where(Payment.reference == reference)
+            )
+    if not tg_id or not reference:
+        raise HTTPException(status_code=400, detail="missing telegram_id or reference")
+
+    return await verify_and_credit("flutterwave", tg_id, reference)
+
 
-    if not (v.get("status") and v["data"]["status"] == "success"):
+async def verify_and_credit(provider_name: str, tg_id: int, reference: str) -> dict:
+    """Verify with the provider (or defer if it's unreachable), then credit tickets."""
+    provider = payment_router.get(provider_name)
+    try:
+        paid_kobo = await provider.verify(reference)
+    except ProviderError as e:
+        logger.warning("Deferring verification of %s: %s", reference, e)
+        await verification_queue.defer(tg_id, reference, provider_name)
+        return {"status": "deferred"}
+
+    if paid_kobo is None:
         raise HTTPException(status_code=400, detail="verification failed")
 
-    # mark/ensure entry
+    status, _ = await credit_payment(tg_id, reference, paid_kobo, provider_name)
+    return {"status": status}
+
+
+async def credit_payment(tg_id: int, reference: str, paid_kobo: int,
+                         provider: str = "paystack") -> tuple[str, int]:
+    """
+    Turn a verified payment into tickets (idempotent per reference).
+    Tickets go to the buyer recorded on the checkout's Payment row; the
+    webhook's telegram_id (unauthenticated) is only used for old links
+    created before checkouts were recorded.
+    Returns ("ok" | "duplicate", tickets credited).
+    """
     async with async_session() as db:
-        # ensure user exists
-        uq = await db.execute(select(User).where(User.telegram_id == tg_id))
-        user = uq.scalar_one_or_none()
-        if not user:
-            user = User(telegram_id=tg_id)
-            db.add(user)
-            await db.flush()
-
-        # if we created a placeholder earlier by reference, fine; else insert now
-        q = await db.execute(select(RaffleEntry).where(RaffleEntry.payment_ref == reference))
-        entry = q.scalar_one_or_none()
-        if not entry:
-            entry = RaffleEntry(user_id=user.id, payment_ref=reference, free_ticket=False)
-            db.add(entry)
+        pq = await db.execute(select(Payment).where(Payment.reference == reference))
+        payment = pq.scalar_one_or_none()
+        if payment and payment.status != "pending":
+            return "duplicate", 0
+
+        if payment:
+            user = await db.get(User, payment.user_id)
+            if str(tg_id) != str(user.telegram_id):
+                logger.warning("Payment %s: webhook names %s, crediting buyer %s",
+                               reference, tg_id, user.telegram_id)
+            tg_id = user.telegram_id
+        else:
+            # ensure user exists
+            uq = await db.execute(select(User).where(User.telegram_id == tg_id))
+            user = uq.scalar_one_or_none()
+            if not user:
+                user = User(telegram_id=tg_id)
+                db.add(user)
+                await db.flush()
+                await rollups.bump(db, new_users=1)
+        # legacy links stored a placeholder entry under the reference
+        dup = await db.scalar(select(RaffleEntry.id).where(RaffleEntry.payment_ref == reference))
+        if dup:
+            return "duplicate", 0
+
+        # the verified amount decides how many tickets were bought: the whole
+        # order if the checkout was paid in full, else only what the amount covers
+        if payment:
+            if paid_kobo >= payment.amount:
+                quantity = payment.quantity
+            else:
+                unit = payment.amount // max(payment.quantity, 1)
+                quantity = paid_kobo // unit if unit else 0
+                logger.warning("Payment %s underpaid: %s of %s kobo, crediting %d of %d ticket(s)",
+                               reference, paid_kobo, payment.amount, quantity, payment.quantity)
+        else:
+            quantity = paid_kobo // kobo(TICKET_PRICE) if TICKET_PRICE > 0 else 1
+        quantity = min(quantity, MAX_TICKETS_PER_ORDER)
+
+        if not payment:
+            payment = Payment(user_id=user.id, provider=provider, reference=reference,
+                              quantity=quantity, amount=paid_kobo)
+            db.add(payment)
+        if quantity <= 0:
+            # kept so a redelivered webhook is a duplicate, not a second look
+            logger.warning("Payment %s of %s kobo covers no ticket", reference, paid_kobo)
+            payment.status = "underpaid"
+            await db.commit()
+            return "underpaid", 0
+        payment.status = "success"
+        payment.paid_at = datetime.datetime.utcnow()
+        first = user.first_paid_at is None
+        if first:
+            user.first_paid_at = payment.paid_at
+        await rollups.bump(
+            db, payment.paid_at, payments=1, tickets_paid=quantity, revenue_kobo=paid_kobo,
+            first_payers=int(first), referred_payers=int(first and user.referred_by is not None),
+        )
 
+        # one bulk insert for all tickets; first keeps the bare reference
+        refs = [reference] + [f"{reference}-{i}" for i in range(2, quantity + 1)]
+        res = await db.execute(
+            insert(RaffleEntry).returning(RaffleEntry.id),
+            [{"user_id": user.id, "payment_ref": r, "free_ticket": False} for r in refs],
+        )
+        ticket_ids = res.scalars().all()
+
+        # confirmation goes out via the outbox, committed with the tickets
+        enqueue(
+            db, tg_id,
+            "✅ <b>Payment confirmed!</b>\n"
+            + ("Your raffle ticket has been added.\n" if quantity == 1
+               else f"Your {quantity} raffle tickets have been added.\n")
+            + "Use /ticket to view your tickets.",
+        )
         await db.commit()
+    outbox.notify()
+    ticket_summaries.invalidate(tg_id)
+
+    if ticket_index.loaded:
+        ticket_index.add_many(ticket_ids, user.id)
+
+    forget_pay_link(int(tg_id), payment.quantity)
+
+    return "ok", quantity
+
+
+# quoted top-level keys of the update types dp has handlers for
+_handled_update_keys: tuple[bytes, ...] = ()
+# Telegram redelivers when we're slow to answer; don't process an update twice
+_recent_update_ids = RecentIds(4096)
+_UPDATE_ID_RE = re.compile(rb'"update_id"\s*:\s*(\d+)')
 
-    # notify user
-    try:
-        await bot.send_message(
-            chat_id=int(tg_id),
-            text="✅ <b>Payment confirmed!</b>\nYour raffle ticket has been added.\nUse /ticket to view your tickets.",
-        )
-    except Exception as e:
-        logger.warning(f"Failed to notify user {tg_id}: {e}")
 
-    return {"status": "ok"}
+async def _read_limited(request: Request, limit: int) -> bytes | None:
+    """Read the body, giving up (None) once it exceeds `limit` bytes."""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > limit:
+        return None
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
 
 
 @app.post(TELEGRAM_WEBHOOK_PATH)
 async def telegram_webhook(request: Request):
     """Handle Telegram -> server webhook."""
-    body = await request.json()
+    # cheapest checks first: header, size, duplicate id -- then parse
+    secret = request.headers.get("x-telegram-bot-api-secret-token", "")
+    if not TELEGRAM_WEBHOOK_SECRET or not hmac.compare_digest(secret.encode(), TELEGRAM_WEBHOOK_SECRET.encode()):
+        return Response(status_code=401)
+    raw = await _read_limited(request, MAX_UPDATE_BYTES)
+    if raw is None:
+        return Response(status_code=413)
+    m = _UPDATE_ID_RE.search(raw)
+    update_id = int(m.group(1)) if m else None
+    if update_id is not None and not _recent_update_ids.add(update_id):
+        return Response(status_code=200)
+
+    # nothing we handle in it: skip pydantic validation entirely
+    if _handled_update_keys and not jsoncodec.mentions_any(raw, _handled_update_keys):
+        return Response(status_code=200)
     try:
-        update = types.Update.model_validate(body)
+        # straight from bytes, and bound to our bot so feed_update doesn't
+        # dump and re-validate the whole update to attach it
+        update = types.Update.model_validate_json(raw, context={"bot": bot})
     except Exception:
         raise HTTPException(status_code=400, detail="invalid telegram update")
-    await dp.feed_update(bot, update)
+    try:
+        await dp.feed_update(bot, update)
+    except Exception:
+        # let Telegram's retry through
+        _recent_update_ids.discard(update_id)
+        raise
     return Response(status_code=200)
 
 
@@ -402,25 +1024,47 @@ async def telegram_webhook(request: Request):
 # ---------------------------------------------------------
 @app.on_event("startup")
 async def on_startup():
+    global _handled_update_keys
     await init_db()
+    async with async_session() as s:
+        hours = await rollups.backfill(s)
+    if hours:
+        logger.info("✅ Dashboard rollups backfilled (%d hours)", hours)
+    if TICKET_INDEX_ENABLED:
+        async with async_session() as s:
+            await ticket_index.load(s)
+        logger.info("✅ Ticket index loaded (%d tickets)", len(ticket_index))
+    async with async_session() as s:
+        await referral_ranking.load(s)
     await set_bot_commands()
+    outbox.start(bot)
+    verification_queue.start(credit_payment)
+    scheduler.register("close_raffle", run_close_job)
+    scheduler.start()
+    used_updates = dp.resolve_used_update_types()
+    _handled_update_keys = tuple(f'"{t}"'.encode() for t in used_updates)
     if PUBLIC_URL:
         try:
             await bot.delete_webhook(drop_pending_updates=True)
             await bot.set_webhook(f"{PUBLIC_URL}{TELEGRAM_WEBHOOK_PATH}",
-                                  allowed_updates=["message", "callback_query"])
+                                  allowed_updates=used_updates,
+                                  secret_token=TELEGRAM_WEBHOOK_SECRET)
             logger.info("✅ Telegram webhook set")
         except Exception as e:
-            logger.error(f"❌ Failed to set Telegram webhook: {e}")
+            logger.error("❌ Failed to set Telegram webhook: %s", e)
     else:
         logger.warning("PUBLIC_URL not set: Telegram webhook NOT configured.")
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    await outbox.stop()
+    await verification_queue.stop()
+    await scheduler.stop()
     try:
         await bot.delete_webhook(drop_pending_updates=True)
     except Exception:
         pass
+    stop_logging()
 
 
 # ---------------------------------------------------------
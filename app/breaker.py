@@ -0,0 +1,86 @@
+# app/breaker.py
+import os
+import time
+import logging
+from typing import Awaitable, Callable
+
+# defaults for every payment provider's breaker
+BREAKER_FAILURES = int(os.getenv("PAYMENT_BREAKER_FAILURES", "5"))   # consecutive failures to open
+BREAKER_SLOW_CALL = float(os.getenv("PAYMENT_BREAKER_SLOW", "4"))    # seconds; slower counts as failure
+BREAKER_RESET = float(os.getenv("PAYMENT_BREAKER_RESET", "30"))      # seconds open before probing
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderError(Exception):
+    """A payment provider couldn't be reached or answered with a server error."""
+
+
+class CircuitOpenError(ProviderError):
+    """Call refused without trying because the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive failures (errors or calls slower
+    than `slow_call`); open -> half_open after `reset_timeout`, when a single
+    probe call is let through; its outcome closes or re-opens the breaker.
+    """
+
+    # set by app.profiling while a trace window is open: hook(name, path, start, seconds, ok)
+    on_call: Callable | None = None
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES,
+                 slow_call: float = BREAKER_SLOW_CALL, reset_timeout: float = BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failures
+        self.slow_call = slow_call
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def _open(self):
+        if self.opened_at is None:
+            logger.warning("%s circuit breaker opened", self.name)
+        self.opened_at = time.monotonic()
+
+    def record(self, ok: bool, elapsed: float = 0.0):
+        if ok and elapsed <= self.slow_call:
+            if self.opened_at is not None:
+                logger.info("%s circuit breaker closed", self.name)
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self._open()
+
+    async def call(self, fn: Callable[..., Awaitable], *args, **kwargs):
+        state = self.state
+        if state == "open" or (state == "half_open" and self._probing):
+            raise CircuitOpenError(f"{self.name} temporarily unavailable")
+        self._probing = state == "half_open"
+        start = time.monotonic()
+        ok = False
+        try:
+            result = await fn(*args, **kwargs)
+            ok = True
+        except Exception:
+            self.record(False)
+            raise
+        finally:
+            self._probing = False
+            hook = CircuitBreaker.on_call
+            if hook is not None:
+                hook(self.name, args[1] if len(args) > 1 else "", start, time.monotonic() - start, ok)
+        self.record(True, time.monotonic() - start)
+        return result
@@ -0,0 +1,123 @@
+# app/dashboard.py
+import hashlib
+import datetime
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import Response
+
+from app import jsoncodec
+from app.database import async_session
+from app.rollups import COUNTERS, hour_of, series, totals
+from app.utils import admin_token_ok
+
+router = APIRouter(prefix="/admin/dashboard")
+
+
+def _check(authorization: str | None):
+    if not admin_token_ok(authorization):
+        raise HTTPException(status_code=401, detail="unauthorized")
+
+
+def _cached(request: Request, payload: dict) -> Response:
+    """JSON response with an ETag; a matching If-None-Match gets an empty 304."""
+    body = jsoncodec.dumps(payload).encode()
+    etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}  # always revalidate, cheaply
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def _window(days: int, granularity: str = "day") -> list[dict]:
+    """Rollup rows for the last `days` days (current hour included), merged per day if asked."""
+    since = hour_of() - datetime.timedelta(days=days) + datetime.timedelta(hours=1)
+    async with async_session() as s:
+        rows = await series(s, since)
+    if granularity == "hour":
+        return [{"t": r["hour"].isoformat(), **{k: r[k] for k in COUNTERS}} for r in rows]
+
+    per_day: dict[datetime.date, dict] = {}
+    for r in rows:
+        day = per_day.setdefault(r["hour"].date(), dict.fromkeys(COUNTERS, 0))
+        for k in COUNTERS:
+            day[k] += r[k]
+    return [{"t": d.isoformat(), **v} for d, v in per_day.items()]
+
+
+def _sum(rows: list[dict], key: str) -> int:
+    return sum(r[key] for r in rows)
+
+
+def _rate(part: int, whole: int) -> float | None:
+    return round(part / whole, 4) if whole else None
+
+
+@router.get("/sales")
+async def sales(request: Request, granularity: str = Query("day"), days: int = Query(7, ge=1, le=366),
+                authorization: str | None = Header(None)):
+    """Paid and free tickets per hour or day."""
+    _check(authorization)
+    if granularity not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="granularity must be hour or day")
+    rows = await _window(min(days, 31) if granularity == "hour" else days, granularity)
+    keys = ("payments", "tickets_paid", "tickets_free", "revenue_kobo")
+    return _cached(request, {
+        "granularity": granularity,
+        "totals": {k: _sum(rows, k) for k in keys},
+        "series": [{"t": r["t"], **{k: r[k] for k in keys}} for r in rows],
+    })
+
+
+@router.get("/conversion")
+async def conversion(request: Request, days: int = Query(30, ge=1, le=366),
+                     authorization: str | None = Header(None)):
+    """Checkouts started (/buy) vs paid, and new users vs first-time payers."""
+    _check(authorization)
+    rows = await _window(days)
+    checkouts, payments = _sum(rows, "checkouts"), _sum(rows, "payments")
+    new_users, first_payers = _sum(rows, "new_users"), _sum(rows, "first_payers")
+    return _cached(request, {
+        "checkouts": checkouts,
+        "payments": payments,
+        "checkout_conversion": _rate(payments, checkouts),
+        "new_users": new_users,
+        "first_payers": first_payers,
+        "user_conversion": _rate(first_payers, new_users),
+        "series": [{"t": r["t"], "checkouts": r["checkouts"], "payments": r["payments"],
+                    "checkout_conversion": _rate(r["payments"], r["checkouts"])} for r in rows],
+    })
+
+
+@router.get("/referrals")
+async def referrals(request: Request, days: int = Query(30, ge=1, le=366),
+                    authorization: str | None = Header(None)):
+    """Referral funnel: referred signups -> referred users who paid, plus free tickets awarded."""
+    _check(authorization)
+    rows = await _window(days)
+    referred, paid = _sum(rows, "referred_users"), _sum(rows, "referred_payers")
+    return _cached(request, {
+        "referred_users": referred,
+        "referred_payers": paid,
+        "referral_conversion": _rate(paid, referred),
+        "free_tickets": _sum(rows, "tickets_free"),
+        "series": [{"t": r["t"], "referred_users": r["referred_users"],
+                    "referred_payers": r["referred_payers"], "free_tickets": r["tickets_free"]}
+                   for r in rows],
+    })
+
+
+@router.get("/revenue")
+async def revenue(request: Request, days: int = Query(30, ge=1, le=366),
+                  authorization: str | None = Header(None)):
+    """Revenue per day for the window, with all-time totals."""
+    _check(authorization)
+    rows = await _window(days)
+    async with async_session() as s:
+        all_time = await totals(s)
+    window_kobo, window_payments = _sum(rows, "revenue_kobo"), _sum(rows, "payments")
+    return _cached(request, {
+        "revenue_kobo": window_kobo,
+        "avg_order_kobo": window_kobo // window_payments if window_payments else None,
+        "all_time": {k: all_time[k] for k in ("revenue_kobo", "payments", "tickets_paid", "tickets_free")},
+        "series": [{"t": r["t"], "revenue_kobo": r["revenue_kobo"], "payments": r["payments"]} for r in rows],
+    })
@@ -1,6 +1,6 @@
 # app/database.py
 import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Index, inspect, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 import os
@@ -22,8 +22,10 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     telegram_id = Column(Integer, unique=True, nullable=False)
     username = Column(String, nullable=True)
-    referral_count = Column(Integer, default=0)
+    referral_count = Column(Integer, default=0)  # progress towards the next free ticket
+    referral_total = Column(Integer, default=0, nullable=False, server_default="0", index=True)  # lifetime
     referred_by = Column(Integer, ForeignKey("users.telegram_id"), nullable=True)
+    first_paid_at = Column(DateTime, nullable=True)  # for the dashboard's conversion funnel
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     tickets = relationship("RaffleEntry", back_populates="user", cascade="all, delete-orphan")
@@ -31,15 +33,134 @@ class User(Base):
 
 class RaffleEntry(Base):
     __tablename__ = "raffle_entries"
+    # ticket numbers never repeat, even after a close-out empties the table
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     payment_ref = Column(String, unique=True, nullable=True)
     free_ticket = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     user = relationship("User", back_populates="tickets")
 
+
+class Payment(Base):
+    """One checkout: a single provider transaction for `quantity` tickets."""
+    __tablename__ = "payments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    provider = Column(String, default="paystack", nullable=False, server_default="paystack")
+    reference = Column(String, unique=True, nullable=False)
+    quantity = Column(Integer, default=1, nullable=False)
+    amount = Column(Integer, nullable=False)  # kobo
+    status = Column(String, default="pending", nullable=False)  # pending | success | underpaid
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    paid_at = Column(DateTime, nullable=True)
+
+
+class ArchivedRaffle(Base):
+    """Summary of a closed raffle whose tickets moved to archived_entries."""
+    __tablename__ = "archived_raffles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String, nullable=True)
+    status = Column(String, default="archiving", nullable=False)  # archiving | archived
+    first_ticket_id = Column(Integer, nullable=True)
+    last_ticket_id = Column(Integer, nullable=False)  # tickets up to this id belong to the raffle
+    ticket_count = Column(Integer, default=0, nullable=False)
+    free_count = Column(Integer, default=0, nullable=False)
+    player_count = Column(Integer, default=0, nullable=False)
+    closed_at = Column(DateTime, default=datetime.datetime.utcnow)
+    archived_at = Column(DateTime, nullable=True)
+    winner_ticket_id = Column(Integer, nullable=True)
+    winner_user_id = Column(Integer, nullable=True)
+    drawn_at = Column(DateTime, nullable=True)
+
+
+class ArchivedEntry(Base):
+    """A raffle_entries row moved out of the hot table on close-out."""
+    __tablename__ = "archived_entries"
+
+    id = Column(Integer, primary_key=True)
+    ticket_id = Column(Integer, nullable=False, server_default="0")  # its id in raffle_entries
+    raffle_id = Column(Integer, ForeignKey("archived_raffles.id"), nullable=False, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    payment_ref = Column(String, nullable=True)
+    free_ticket = Column(Boolean, default=False)
+    created_at = Column(DateTime)
+
+    # per-holder ticket counts for a raffle (draw notifications)
+    __table_args__ = (Index("ix_archived_entries_raffle_user", "raffle_id", "user_id"),)
+
+
+class DeferredVerification(Base):
+    """Payment webhook whose verify call couldn't be made (provider down); retried later."""
+    __tablename__ = "deferred_verifications"
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String, default="paystack", nullable=False, server_default="paystack")
+    reference = Column(String, unique=True, nullable=False)
+    telegram_id = Column(Integer, nullable=False)
+    status = Column(String, default="pending", nullable=False, index=True)  # pending | done | failed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class OutboxMessage(Base):
+    """Telegram message written in the same transaction as the change it reports."""
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    chat_id = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
+    status = Column(String, default="pending", nullable=False, index=True)  # pending | sending | sent | failed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    locked_by = Column(String, nullable=True)  # batch that claimed the row while "sending"
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+
+class HourlyStats(Base):
+    """
+    Dashboard rollup: one row per UTC hour, incremented by the events
+    themselves (app/rollups.py) so the dashboard never scans raw tables.
+    """
+    __tablename__ = "hourly_stats"
+
+    hour = Column(DateTime, primary_key=True)
+    checkouts = Column(Integer, default=0, nullable=False, server_default="0")      # /buy links created
+    payments = Column(Integer, default=0, nullable=False, server_default="0")       # checkouts paid
+    tickets_paid = Column(Integer, default=0, nullable=False, server_default="0")
+    tickets_free = Column(Integer, default=0, nullable=False, server_default="0")   # referral awards
+    revenue_kobo = Column(Integer, default=0, nullable=False, server_default="0")
+    new_users = Column(Integer, default=0, nullable=False, server_default="0")
+    first_payers = Column(Integer, default=0, nullable=False, server_default="0")   # users' first payment
+    referred_users = Column(Integer, default=0, nullable=False, server_default="0") # signups credited to a referrer
+    referred_payers = Column(Integer, default=0, nullable=False, server_default="0")  # ...who went on to pay
+
+
+class ScheduledJob(Base):
+    """A job run once at run_at by whichever instance claims its lease first."""
+    __tablename__ = "scheduled_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # close_raffle
+    run_at = Column(DateTime, nullable=False, index=True)
+    status = Column(String, default="pending", nullable=False, index=True)  # pending | running | done | failed | cancelled
+    payload = Column(Text, nullable=False, default="{}")  # JSON; handlers checkpoint progress here
+    attempts = Column(Integer, default=0, nullable=False)
+    locked_by = Column(String, nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
 # ---------------------------------
 # Async Database Engine + Session
 # ---------------------------------
@@ -49,6 +170,74 @@ async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession
 # ---------------------------------
 # Utility to Initialize DB
 # ---------------------------------
+def _add_missing_columns(conn) -> list[str]:
+    """
+    create_all() never alters existing tables; add columns introduced since
+    the DB was created (plus their indexes). Returns "table.column" names added.
+    """
+    insp = inspect(conn)
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(conn.dialect)}"
+            if col.server_default is not None:
+                ddl += f" DEFAULT {col.server_default.arg}"
+            if not col.nullable:
+                ddl += " NOT NULL"
+            conn.execute(text(ddl))
+            added.append(f"{table.name}.{col.name}")
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    return added
+
+
+def _autoincrement_ticket_ids(conn):
+    """
+    SQLite reuses the highest rowid once a close-out empties raffle_entries;
+    rebuild a table created without AUTOINCREMENT and start its sequence
+    past every ticket id already handed out.
+    """
+    if conn.dialect.name != "sqlite":
+        return  # serial/identity columns never go back
+    ddl = conn.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'raffle_entries'"
+    )).scalar()
+    if "AUTOINCREMENT" in ddl.upper():
+        return
+    table = RaffleEntry.__table__
+    cols = ", ".join(c.name for c in table.columns)
+    conn.execute(text("ALTER TABLE raffle_entries RENAME TO raffle_entries_old"))
+    for index in table.indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    table.create(conn)
+    conn.execute(text(f"INSERT INTO raffle_entries ({cols}) SELECT {cols} FROM raffle_entries_old"))
+    conn.execute(text("DROP TABLE raffle_entries_old"))
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'raffle_entries'"))
+    conn.execute(text(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'raffle_entries', MAX("
+        "(SELECT COALESCE(MAX(id), 0) FROM raffle_entries), "
+        "(SELECT COALESCE(MAX(ticket_id), 0) FROM archived_entries))"
+    ))
+
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        added = await conn.run_sync(_add_missing_columns)
+        if "users.referral_total" in added:
+            # lifetime totals weren't kept before; best we have is the current count
+            await conn.execute(text("UPDATE users SET referral_total = COALESCE(referral_count, 0)"))
+        if "users.first_paid_at" in added:
+            await conn.execute(text(
+                "UPDATE users SET first_paid_at = (SELECT MIN(paid_at) FROM payments "
+                "WHERE payments.user_id = users.id AND payments.status = 'success')"
+            ))
+        if "archived_entries.ticket_id" in added:
+            # archived rows used to keep the ticket id as their primary key
+            await conn.execute(text("UPDATE archived_entries SET ticket_id = id"))
+        await conn.run_sync(_autoincrement_ticket_ids)
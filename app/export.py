@@ -0,0 +1,123 @@
+# app/export.py
+import os
+import io
+import csv
+import zlib
+import datetime
+from typing import AsyncIterator
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from aiogram.types import InputFile
+from sqlalchemy import select
+
+from app.database import async_session, User, RaffleEntry, Payment
+from app import jsoncodec
+from app.utils import admin_token_ok
+
+router = APIRouter()
+EXPORT_CHUNK = int(os.getenv("EXPORT_CHUNK", "5000"))  # rows per DB fetch / output chunk
+
+# dataset -> (column names, key column the export pages by, query); the key is the first column
+DATASETS = {
+    "entries": (
+        ["ticket_id", "created_at", "free_ticket", "payment_ref", "user_id", "telegram_id", "username"],
+        RaffleEntry.id,
+        lambda: select(
+            RaffleEntry.id, RaffleEntry.created_at, RaffleEntry.free_ticket, RaffleEntry.payment_ref,
+            User.id, User.telegram_id, User.username,
+        ).join(User, User.id == RaffleEntry.user_id).order_by(RaffleEntry.id),
+    ),
+    "payments": (
+        ["payment_id", "reference", "status", "quantity", "amount_kobo", "created_at", "paid_at",
+         "user_id", "telegram_id", "username"],
+        Payment.id,
+        lambda: select(
+            Payment.id, Payment.reference, Payment.status, Payment.quantity, Payment.amount,
+            Payment.created_at, Payment.paid_at, User.id, User.telegram_id, User.username,
+        ).join(User, User.id == Payment.user_id).order_by(Payment.id),
+    ),
+}
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def _plain(v):
+    return v.isoformat(sep=" ") if isinstance(v, datetime.datetime) else v
+
+
+async def iter_export(dataset: str, fmt: str, chunk: int = EXPORT_CHUNK) -> AsyncIterator[bytes]:
+    """
+    Yield the dataset as CSV / NDJSON, one encoded block per `chunk` rows.
+    Rows are read by key in pages, each in its own short session, so memory
+    stays flat with table size and no read lock is held while the consumer
+    (an HTTP client, a Telegram upload) works through a page; with SQLite's
+    rollback journal an open cursor would block every writer until the end.
+    """
+    columns, key, query = DATASETS[dataset]
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == "csv" else None
+    if writer:
+        writer.writerow(columns)
+
+    last_id = 0
+    while True:
+        async with async_session() as s:
+            rows = (await s.execute(query().where(key > last_id).limit(chunk))).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        if writer:
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                buf.write(jsoncodec.dumps(dict(zip(columns, map(_plain, row)))))
+                buf.write("\n")
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    z = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    async for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+
+class StreamInputFile(InputFile):
+    """Telegram upload fed from an async iterator, never held in memory whole."""
+
+    def __init__(self, chunks: AsyncIterator[bytes], filename: str):
+        super().__init__(filename=filename)
+        self.chunks = chunks
+
+    async def read(self, bot):
+        async for chunk in self.chunks:
+            yield chunk
+
+
+def export_filename(dataset: str, fmt: str) -> str:
+    return f"{dataset}-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+
+
+@router.get("/admin/export")
+async def export_endpoint(
+    dataset: str = Query("entries"),
+    format: str = Query("csv"),
+    authorization: str | None = Header(None),
+):
+    """Stream a dataset as CSV/NDJSON. Requires `Authorization: Bearer $ADMIN_API_TOKEN`."""
+    if not admin_token_ok(authorization):
+        raise HTTPException(status_code=401, detail="unauthorized")
+    if dataset not in DATASETS or format not in FORMATS:
+        raise HTTPException(status_code=400, detail="unknown dataset or format")
+
+    return StreamingResponse(
+        iter_export(dataset, format),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(dataset, format)}"'},
+    )
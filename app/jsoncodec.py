@@ -0,0 +1,28 @@
+# app/jsoncodec.py
+"""JSON helpers for the webhook paths: orjson when installed, stdlib json otherwise."""
+import json
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def loads(data: bytes | str):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def mentions_any(raw: bytes, keys: tuple[bytes, ...]) -> bool:
+    """
+    Cheap pre-check on raw JSON: does any of the quoted keys (b'"message"')
+    appear anywhere? False means the document certainly has none of them.
+    """
+    return any(k in raw for k in keys)
@@ -0,0 +1,123 @@
+# app/leaderboard.py
+import os
+import time
+
+from sqlalchemy import select, func
+
+from app.database import User
+
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "10"))
+# referrals handled by other workers only show up on reload; this bounds how stale ranks get
+LEADERBOARD_TTL = float(os.getenv("LEADERBOARD_TTL", "60"))  # seconds
+
+
+class ReferralRanking:
+    """
+    Ranks users by lifetime referrals without sorting per request.
+    Keeps a Fenwick tree over referral totals (how many users have exactly
+    N referrals), so a rank is a prefix sum and a referral is a point update,
+    both O(log max_total). Users with no referrals are not ranked.
+    Referrals on this worker update it in place; refresh() rebuilds it every
+    LEADERBOARD_TTL seconds to pick up the ones other workers handled.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._tree = [0] * 65  # 1-based Fenwick array over totals 1..64
+        self.ranked = 0
+        self.loaded = False
+        self._loaded_at = 0.0
+        self._top: list[tuple[str, int]] | None = None
+        self._top_at = 0.0
+
+    def _size(self) -> int:
+        return len(self._tree) - 1
+
+    def _grow(self, total: int):
+        counts = [self._count_at(v) for v in range(1, self._size() + 1)]
+        size = self._size()
+        while size < total:
+            size *= 2
+        self._tree = [0] * (size + 1)
+        for v, c in enumerate(counts, start=1):
+            if c:
+                self._add(v, c)
+
+    def _add(self, total: int, delta: int):
+        i = total
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, total: int) -> int:
+        """Number of ranked users with 1..total referrals."""
+        i, s = min(total, self._size()), 0
+        while i > 0:
+            s += self._tree[i]
+            i -= i & -i
+        return s
+
+    def _count_at(self, total: int) -> int:
+        return self._prefix(total) - self._prefix(total - 1)
+
+    def _set(self, total: int, delta: int):
+        if total <= 0:
+            return
+        if total > self._size():
+            self._grow(total)
+        self._add(total, delta)
+        self.ranked += delta
+
+    async def load(self, session):
+        """Build from one GROUP BY over the indexed referral_total column."""
+        self.reset()
+        q = await session.execute(
+            select(User.referral_total, func.count(User.id))
+            .where(User.referral_total > 0)
+            .group_by(User.referral_total)
+        )
+        for total, n in q.all():
+            self._set(total, n)
+        self.loaded = True
+        self._loaded_at = time.monotonic()
+
+    async def refresh(self, session):
+        """Reload if the last load is older than LEADERBOARD_TTL (no-op until first loaded)."""
+        if self.loaded and time.monotonic() - self._loaded_at >= LEADERBOARD_TTL:
+            await self.load(session)
+
+    def bump(self, old_total: int, new_total: int):
+        """Move one user from old_total to new_total referrals."""
+        self._set(old_total, -1)
+        self._set(new_total, +1)
+        top = self._top
+        if top is not None and (len(top) < LEADERBOARD_SIZE or new_total >= top[-1][1]):
+            self._top = None  # the change reaches the cached top-N
+
+    def rank(self, total: int) -> int | None:
+        """1-based position (ties share a rank), or None for users with no referrals."""
+        if total <= 0:
+            return None
+        return self.ranked - self._prefix(total) + 1
+
+    async def top(self, session) -> list[tuple[str, int]]:
+        """Cached top-N as (display name, lifetime referrals); refreshed after it changes or LEADERBOARD_TTL."""
+        now = time.monotonic()
+        if self._top is None or now - self._top_at >= LEADERBOARD_TTL:
+            q = await session.execute(
+                select(User.username, User.telegram_id, User.referral_total)
+                .where(User.referral_total > 0)
+                .order_by(User.referral_total.desc(), User.id)
+                .limit(LEADERBOARD_SIZE)
+            )
+            self._top = [
+                (f"@{username}" if username else str(tg_id), total)
+                for username, tg_id, total in q.all()
+            ]
+            self._top_at = now
+        return self._top
+
+
+referral_ranking = ReferralRanking()
@@ -0,0 +1,170 @@
+# app/logconfig.py
+"""
+Logging that never blocks the event loop: handlers on the loop thread only
+put records on a bounded queue, and a QueueListener thread formats and writes
+them. Records carry the update_id / user_id of the update being handled.
+"""
+import os
+import sys
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+import datetime
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from app import jsoncodec
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# fraction of records logged with extra={"sample": True} that are kept (INFO and below)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+update_id_var: ContextVar[int | None] = ContextVar("log_update_id", default=None)
+user_id_var: ContextVar[int | None] = ContextVar("log_user_id", default=None)
+
+# attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sample", "update_id", "user_id"}
+
+
+class _ContextFilter(logging.Filter):
+    """Runs in the logging task itself (not the listener), so it sees that task's contextvars."""
+
+    def filter(self, record):
+        record.update_id = update_id_var.get()
+        record.user_id = user_id_var.get()
+        return True
+
+
+class _SampleFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, "sample", False) and record.levelno <= logging.INFO:
+            return random.random() < self.rate
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that neither blocks nor formats on the caller's thread.
+    The stock prepare() renders msg % args up front; we leave that to the
+    listener. When the queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        out = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                  .isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "update_id", None) is not None:
+            out["update_id"] = record.update_id
+        if getattr(record, "user_id", None) is not None:
+            out["user_id"] = record.user_id
+        if getattr(record, "sample", False):
+            out["sample_rate"] = LOG_SAMPLE_RATE
+        for k, v in vars(record).items():
+            if k not in _RECORD_ATTRS and k not in out:
+                out[k] = v if isinstance(v, (str, int, float, bool, type(None))) else str(v)
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return jsoncodec.dumps(out)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record):
+        s = super().format(record)
+        if getattr(record, "update_id", None) is not None:
+            s += f" [update={record.update_id} user={record.user_id}]"
+        return s
+
+
+_listener: logging.handlers.QueueListener | None = None
+queue_handler: _DroppingQueueHandler | None = None
+
+
+def setup_logging(stream=None):
+    """Route the root logger through a background QueueListener. Idempotent."""
+    global _listener, queue_handler
+    if _listener is not None:
+        return
+
+    out = logging.StreamHandler(stream or sys.stderr)
+    out.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else
+                     _TextFormatter("%(asctime)s [%(levelname)s] %(name)s - %(message)s"))
+
+    queue_handler = _DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(_SampleFilter(LOG_SAMPLE_RATE))
+    queue_handler.addFilter(_ContextFilter())
+
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, out, respect_handler_level=True)
+    _listener.out = out
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush what's queued, stop the listener thread and log directly from then on."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        root = logging.getLogger()
+        root.removeHandler(queue_handler)
+        root.addHandler(_listener.out)
+        _listener = None
+
+
+def dropped_records() -> int:
+    """Records thrown away because the queue was full (the writer couldn't keep up)."""
+    return queue_handler.dropped if queue_handler else 0
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """Outer update middleware: tags every log line emitted while handling an update."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = getattr(event.event, "from_user", None)
+        t1 = update_id_var.set(event.update_id)
+        t2 = user_id_var.set(user.id if user else None)
+        try:
+            return await handler(event, data)
+        finally:
+            user_id_var.reset(t2)
+            update_id_var.reset(t1)
@@ -0,0 +1,143 @@
+# app/outbox.py
+import os
+import socket
+import asyncio
+import logging
+import secrets
+import datetime
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter, TelegramBadRequest
+from sqlalchemy import select, update, or_, and_
+
+from app.database import async_session, OutboxMessage
+
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "25"))          # Telegram allows ~30 msg/s
+OUTBOX_POLL = float(os.getenv("OUTBOX_POLL", "5"))           # seconds between idle polls
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "60"))         # seconds a claimed batch has to be sent
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(session, chat_id: int, text: str, not_before: datetime.datetime | None = None):
+    """Queue a message inside the caller's transaction; it is sent after commit (and not_before)."""
+    msg = OutboxMessage(chat_id=int(chat_id), text=text)
+    if not_before is not None:
+        msg.next_attempt_at = not_before
+    session.add(msg)
+
+
+class OutboxDispatcher:
+    """
+    Background task that drains pending outbox rows in batches. Each batch is
+    claimed with a conditional UPDATE before anything is sent, so with several
+    workers a row goes to exactly one of them; a batch whose worker died
+    mid-send is picked up again once its lease lapses.
+    """
+
+    def __init__(self):
+        self.instance = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.bot: Bot | None = None
+
+    def start(self, bot: Bot):
+        self.bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self):
+        """Call after committing new rows to send them without waiting for the poll."""
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                sent = await self.drain_once()
+            except Exception as e:
+                logger.error("Outbox dispatch failed: %s", e)
+                sent = 0
+            if sent >= OUTBOX_BATCH:
+                # probably more waiting; pace batches to stay under the rate limit
+                await asyncio.sleep(1)
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=OUTBOX_POLL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _claim(self, s, now: datetime.datetime) -> str | None:
+        """Mark up to OUTBOX_BATCH due rows as ours; returns the claim id (None if nothing was due)."""
+        due = or_(
+            and_(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= now),
+            and_(OutboxMessage.status == "sending", OutboxMessage.locked_until < now),
+        )
+        claim = f"{self.instance}:{secrets.token_hex(4)}"
+        ids = select(OutboxMessage.id).where(due).order_by(OutboxMessage.id).limit(OUTBOX_BATCH)
+        res = await s.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(ids.scalar_subquery()), due)  # re-checked: another worker may win
+            .values(status="sending", locked_by=claim,
+                    locked_until=now + datetime.timedelta(seconds=OUTBOX_LEASE))
+            .execution_options(synchronize_session=False)
+        )
+        await s.commit()
+        return claim if res.rowcount else None
+
+    async def drain_once(self) -> int:
+        """Claim and send one batch of due messages; returns how many rows were handled."""
+        now = datetime.datetime.utcnow()
+        async with async_session() as s:
+            claim = await self._claim(s, now)
+            if claim is None:
+                return 0
+            rows = (await s.execute(
+                select(OutboxMessage).where(OutboxMessage.locked_by == claim).order_by(OutboxMessage.id)
+            )).scalars().all()
+
+            results = await asyncio.gather(
+                *(self.bot.send_message(chat_id=r.chat_id, text=r.text) for r in rows),
+                return_exceptions=True,
+            )
+
+            now = datetime.datetime.utcnow()
+            sent_ids = []
+            for row, res in zip(rows, results):
+                if not isinstance(res, Exception):
+                    sent_ids.append(row.id)
+                    continue
+                row.status, row.locked_by, row.locked_until = "pending", None, None
+                row.attempts += 1
+                row.last_error = str(res)[:255]
+                if isinstance(res, (TelegramForbiddenError, TelegramBadRequest)) \
+                        or row.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    # user blocked the bot / chat gone / out of retries
+                    row.status = "failed"
+                    logger.warning("Outbox message %s to %s failed: %s", row.id, row.chat_id, res)
+                else:
+                    delay = res.retry_after if isinstance(res, TelegramRetryAfter) \
+                        else min(2 ** row.attempts, 3600)
+                    row.next_attempt_at = now + datetime.timedelta(seconds=delay)
+
+            if sent_ids:
+                await s.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id.in_(sent_ids))
+                    .values(status="sent", sent_at=now, locked_by=None, locked_until=None)
+                )
+            await s.commit()
+            return len(rows)
+
+
+outbox = OutboxDispatcher()
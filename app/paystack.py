@@ -0,0 +1,48 @@
+# app/paystack.py
+import os
+import asyncio
+
+import aiohttp
+
+from app.breaker import CircuitBreaker, CircuitOpenError, ProviderError
+
+PAYSTACK_SECRET_KEY = os.getenv("PAYSTACK_SECRET_KEY")
+PAYSTACK_API_URL = os.getenv("PAYSTACK_API_URL", "https://api.paystack.co")
+PAYSTACK_TIMEOUT = float(os.getenv("PAYSTACK_TIMEOUT", "8"))  # seconds, whole request
+
+
+class PaystackError(ProviderError):
+    """Paystack couldn't be reached or answered with a server error."""
+
+
+breaker = CircuitBreaker("Paystack")
+
+
+async def _request(method: str, path: str, **kwargs) -> dict:
+    headers = {"Authorization": f"Bearer {PAYSTACK_SECRET_KEY}",
+               "Content-Type": "application/json"}
+    timeout = aiohttp.ClientTimeout(total=PAYSTACK_TIMEOUT)
+    try:
+        async with aiohttp.ClientSession(timeout=timeout) as s:
+            req = s.post if method == "POST" else s.get
+            async with req(f"{PAYSTACK_API_URL}{path}", headers=headers, **kwargs) as resp:
+                if resp.status >= 500:
+                    raise PaystackError(f"Paystack HTTP {resp.status}")
+                return await resp.json()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise PaystackError(str(e) or type(e).__name__) from e
+
+
+async def initialize_transaction(payload: dict) -> dict:
+    return await breaker.call(_request, "POST", "/transaction/initialize", json=payload)
+
+
+async def verify_transaction(reference: str) -> dict:
+    return await breaker.call(_request, "GET", f"/transaction/verify/{reference}")
+
+
+def verified_amount(v: dict) -> int | None:
+    """Kobo paid if the verify response says the charge succeeded, else None."""
+    if v.get("status") and (v.get("data") or {}).get("status") == "success":
+        return int(v["data"].get("amount") or 0)
+    return None
@@ -0,0 +1,263 @@
+# app/profiling.py
+"""
+On-demand tracing. Nothing here is hooked in until a window is started:
+the middlewares, SQLAlchemy listeners and HTTP hooks are registered for the
+window only and removed afterwards, so a disabled profiler costs nothing.
+"""
+import os
+import io
+import json
+import time
+import random
+import asyncio
+import cProfile
+import logging
+import pstats
+import datetime
+import tracemalloc
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import Update
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import FileResponse
+from sqlalchemy import event
+
+from app.breaker import CircuitBreaker
+from app.database import engine
+from app.utils import admin_token_ok, spawn
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "300"))
+PROFILE_TOP = 40  # functions / allocation sites kept in the report
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# spans of the update being traced in this task (None = not sampled)
+_spans: ContextVar[list | None] = ContextVar("trace_spans", default=None)
+
+
+def _span(spans: list, kind: str, name: str, start: float, seconds: float, **args):
+    spans.append({"cat": kind, "name": name, "ts": start, "dur": seconds, "args": args})
+
+
+class _UpdateTracer(BaseMiddleware):
+    """Outer update middleware: decides sampling and records the whole-update span."""
+
+    def __init__(self, window: "TraceWindow"):
+        self.window = window
+
+    async def __call__(self, handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+                       event: Update, data: Dict[str, Any]) -> Any:
+        w = self.window
+        if random.random() >= w.sample_rate:
+            return await handler(event, data)
+
+        spans: list = []
+        token = _spans.set(spans)
+        # cProfile is per-thread; profile one sampled update at a time
+        prof = None
+        if not w.profiling:
+            w.profiling = True
+            prof = cProfile.Profile()
+            prof.enable()
+        start = time.monotonic()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.monotonic() - start
+            if prof:
+                prof.disable()
+                w.stats.add(prof) if w.stats else setattr(w, "stats", pstats.Stats(prof))
+                w.profiling = False
+            _spans.reset(token)
+            user = event.event.from_user.id if getattr(event.event, "from_user", None) else None
+            _span(spans, "update", event.event_type, start, elapsed,
+                  update_id=event.update_id, user_id=user)
+            w.updates.append(spans)
+
+
+class _HandlerTracer(BaseMiddleware):
+    """Inner middleware on message / callback_query: records which handler ran."""
+
+    async def __call__(self, handler, event, data):
+        spans = _spans.get()
+        if spans is None:
+            return await handler(event, data)
+        start = time.monotonic()
+        try:
+            return await handler(event, data)
+        finally:
+            h = data.get("handler")
+            name = getattr(getattr(h, "callback", None), "__name__", "handler")
+            _span(spans, "handler", name, start, time.monotonic() - start)
+
+
+class _TelegramTracer(BaseRequestMiddleware):
+    """Bot session middleware: one span per Telegram API call."""
+
+    async def __call__(self, make_request, bot, method):
+        spans = _spans.get()
+        if spans is None:
+            return await make_request(bot, method)
+        start = time.monotonic()
+        try:
+            return await make_request(bot, method)
+        finally:
+            _span(spans, "telegram", type(method).__name__, start, time.monotonic() - start)
+
+
+def _before_sql(conn, cursor, statement, parameters, context, executemany):
+    if _spans.get() is not None:
+        conn.info.setdefault("trace_start", []).append(time.monotonic())
+
+
+def _after_sql(conn, cursor, statement, parameters, context, executemany):
+    spans = _spans.get()
+    if spans is None:
+        return
+    stack = conn.info.get("trace_start")
+    if stack:
+        start = stack.pop()
+        _span(spans, "sql", statement[:200], start, time.monotonic() - start, many=executemany)
+
+
+def _provider_call(name: str, path: str, start: float, seconds: float, ok: bool):
+    spans = _spans.get()
+    if spans is not None:
+        _span(spans, "http", f"{name} {path}", start, seconds, ok=ok)
+
+
+class TraceWindow:
+    def __init__(self, seconds: int, sample_rate: float):
+        self.seconds = seconds
+        self.sample_rate = sample_rate
+        self.started = time.monotonic()
+        self.updates: list[list] = []
+        self.stats: pstats.Stats | None = None
+        self.profiling = False
+
+
+class Profiler:
+    def __init__(self):
+        self.window: TraceWindow | None = None
+        self.last_path: str | None = None
+        self.bot: Bot | None = None
+        self.dp: Dispatcher | None = None
+
+    def attach(self, bot: Bot, dp: Dispatcher):
+        """Bind the running bot; bot.py is __main__ in production, so it isn't importable here."""
+        self.bot, self.dp = bot, dp
+
+    @property
+    def active(self) -> bool:
+        return self.window is not None
+
+    async def run(self, seconds: int, sample_rate: float) -> str:
+        """Trace for `seconds`, sampling `sample_rate` of updates; returns the JSON file path."""
+        if self.window:
+            raise RuntimeError("a profiling window is already open")
+        bot, dp = self.bot, self.dp
+        seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+        w = self.window = TraceWindow(seconds, max(0.0, min(sample_rate, 1.0)))
+
+        update_mw, handler_mw, tg_mw = _UpdateTracer(w), _HandlerTracer(), _TelegramTracer()
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+
+        dp.update.outer_middleware.register(update_mw)
+        dp.message.middleware.register(handler_mw)
+        dp.callback_query.middleware.register(handler_mw)
+        bot.session.middleware.register(tg_mw)
+        event.listen(engine.sync_engine, "before_cursor_execute", _before_sql)
+        event.listen(engine.sync_engine, "after_cursor_execute", _after_sql)
+        CircuitBreaker.on_call = _provider_call
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            CircuitBreaker.on_call = None
+            event.remove(engine.sync_engine, "after_cursor_execute", _after_sql)
+            event.remove(engine.sync_engine, "before_cursor_execute", _before_sql)
+            bot.session.middleware.unregister(tg_mw)
+            dp.callback_query.middleware.unregister(handler_mw)
+            dp.message.middleware.unregister(handler_mw)
+            dp.update.outer_middleware.unregister(update_mw)
+            after = tracemalloc.take_snapshot()
+            if started_tracemalloc:
+                tracemalloc.stop()
+            self.window = None
+
+        path = self._write(w, before, after)
+        self.last_path = path
+        logger.info("Profile written to %s (%d sampled updates)", path, len(w.updates))
+        return path
+
+    def _write(self, w: TraceWindow, before, after) -> str:
+        # Chrome trace-event format: open in chrome://tracing or ui.perfetto.dev
+        events = []
+        for tid, spans in enumerate(w.updates, start=1):
+            for s in spans:
+                events.append({
+                    "name": s["name"], "cat": s["cat"], "ph": "X", "pid": 1, "tid": tid,
+                    "ts": round((s["ts"] - w.started) * 1e6), "dur": round(s["dur"] * 1e6),
+                    "args": s["args"],
+                })
+
+        profile = ""
+        if w.stats:
+            out = io.StringIO()
+            w.stats.stream = out
+            w.stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+            profile = out.getvalue()
+
+        # the profiler's own bookkeeping would otherwise top the list
+        own = [tracemalloc.Filter(False, m.__file__) for m in (cProfile, pstats, tracemalloc)]
+        own.append(tracemalloc.Filter(False, __file__))
+        growth = [
+            {"where": str(d.traceback[0]), "size_diff": d.size_diff, "count_diff": d.count_diff}
+            for d in after.filter_traces(own).compare_to(before.filter_traces(own), "lineno")[:PROFILE_TOP]
+        ]
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"trace-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.json")
+        with open(path, "w") as f:
+            json.dump({
+                "traceEvents": events,
+                "window": {"seconds": w.seconds, "sample_rate": w.sample_rate,
+                           "sampled_updates": len(w.updates)},
+                "profile": profile,
+                "memory_growth": growth,
+            }, f)
+        return path
+
+
+profiler = Profiler()
+
+
+def _check(authorization: str | None):
+    if not admin_token_ok(authorization):
+        raise HTTPException(status_code=401, detail="unauthorized")
+
+
+@router.post("/admin/profile")
+async def start_profile(seconds: int = Query(30), rate: float = Query(0.1),
+                        authorization: str | None = Header(None)):
+    """Open a tracing window in the background. Requires `Authorization: Bearer $ADMIN_API_TOKEN`."""
+    _check(authorization)
+    if profiler.active:
+        raise HTTPException(status_code=409, detail="profiling already running")
+    spawn(profiler.run(seconds, rate), name="profile")
+    return {"status": "started", "seconds": min(seconds, PROFILE_MAX_SECONDS), "rate": rate}
+
+
+@router.get("/admin/profile/latest")
+async def latest_profile(authorization: str | None = Header(None)):
+    _check(authorization)
+    if not profiler.last_path or not os.path.exists(profiler.last_path):
+        raise HTTPException(status_code=404, detail="no profile yet")
+    return FileResponse(profiler.last_path, media_type="application/json")
@@ -0,0 +1,286 @@
+# app/providers.py
+import os
+import time
+import asyncio
+import logging
+import datetime
+from collections import deque
+from typing import Awaitable, Callable
+
+import aiohttp
+from sqlalchemy import select
+
+from app import paystack
+from app.breaker import CircuitBreaker, ProviderError
+from app.database import async_session, DeferredVerification
+
+FLW_SECRET_KEY = os.getenv("FLW_SECRET_KEY")
+FLW_API_URL = os.getenv("FLW_API_URL", "https://api.flutterwave.com/v3")
+FLW_TIMEOUT = float(os.getenv("FLW_TIMEOUT", "8"))
+CURRENCY = os.getenv("CURRENCY", "NGN")
+
+# a provider's success rate covers its last PROVIDER_WINDOW init calls made
+# within PROVIDER_WINDOW_SECONDS (so a provider that was skipped after failing
+# gets tried again later); PROVIDER_LATENCY_SCALE seconds of latency halve its score
+PROVIDER_WINDOW = int(os.getenv("PROVIDER_WINDOW", "50"))
+PROVIDER_WINDOW_SECONDS = float(os.getenv("PROVIDER_WINDOW_SECONDS", "300"))
+PROVIDER_LATENCY_SCALE = float(os.getenv("PROVIDER_LATENCY_SCALE", "2"))
+
+VERIFY_RETRY_POLL = float(os.getenv("VERIFY_RETRY_POLL", "15"))
+VERIFY_MAX_ATTEMPTS = int(os.getenv("VERIFY_MAX_ATTEMPTS", "20"))
+
+logger = logging.getLogger(__name__)
+
+
+class FlutterwaveError(ProviderError):
+    """Flutterwave couldn't be reached or answered with a server error."""
+
+
+class PaymentProvider:
+    """
+    One checkout provider. Subclasses implement _initialize/_verify; this
+    class keeps the rolling success rate and init latency used for routing.
+    """
+    name = ""
+    label = ""
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.outcomes = deque(maxlen=PROVIDER_WINDOW)  # (monotonic time, ok) per init call
+        self.latency = 0.0  # EWMA of successful init latency, seconds
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    @property
+    def success_rate(self) -> float:
+        cutoff = time.monotonic() - PROVIDER_WINDOW_SECONDS
+        recent = [ok for t, ok in self.outcomes if t >= cutoff]
+        return sum(recent) / len(recent) if recent else 1.0
+
+    def score(self) -> float:
+        if self.breaker.state == "open":
+            return 0.0
+        return self.success_rate / (1 + self.latency / PROVIDER_LATENCY_SCALE)
+
+    async def initialize(self, reference: str, amount_kobo: int, telegram_id: int,
+                         quantity: int, callback_url: str | None) -> str:
+        """Create the checkout; returns the URL to send the user to."""
+        start = time.monotonic()
+        try:
+            url = await self._initialize(reference, amount_kobo, telegram_id, quantity, callback_url)
+        except Exception:
+            self.outcomes.append((time.monotonic(), False))
+            raise
+        if not url:
+            self.outcomes.append((time.monotonic(), False))
+            raise ProviderError(f"{self.label} did not return a checkout link")
+        elapsed = time.monotonic() - start
+        self.latency = elapsed if not self.latency else 0.8 * self.latency + 0.2 * elapsed
+        self.outcomes.append((time.monotonic(), True))
+        return url
+
+    async def verify(self, reference: str) -> int | None:
+        """Kobo paid if the transaction succeeded, None if it didn't; raises ProviderError if unreachable."""
+        return await self._verify(reference)
+
+    async def _initialize(self, reference, amount_kobo, telegram_id, quantity, callback_url) -> str | None:
+        raise NotImplementedError
+
+    async def _verify(self, reference: str) -> int | None:
+        raise NotImplementedError
+
+
+class PaystackProvider(PaymentProvider):
+    name = "paystack"
+    label = "Paystack"
+
+    @property
+    def configured(self) -> bool:
+        return bool(paystack.PAYSTACK_SECRET_KEY)
+
+    async def _initialize(self, reference, amount_kobo, telegram_id, quantity, callback_url):
+        res = await paystack.initialize_transaction({
+            "email": f"user_{telegram_id}@megawinraffle.com",
+            "amount": amount_kobo,
+            "reference": reference,
+            "metadata": {"telegram_id": telegram_id, "quantity": quantity},
+            "callback_url": callback_url,  # optional; webhook does server-to-server
+        })
+        if res.get("status"):
+            return res["data"]["authorization_url"]
+        return None
+
+    async def _verify(self, reference):
+        return paystack.verified_amount(await paystack.verify_transaction(reference))
+
+
+flutterwave_breaker = CircuitBreaker("Flutterwave")
+
+
+async def _flw_request(method: str, path: str, **kwargs) -> dict:
+    headers = {"Authorization": f"Bearer {FLW_SECRET_KEY}", "Content-Type": "application/json"}
+    timeout = aiohttp.ClientTimeout(total=FLW_TIMEOUT)
+    try:
+        async with aiohttp.ClientSession(timeout=timeout) as s:
+            req = s.post if method == "POST" else s.get
+            async with req(f"{FLW_API_URL}{path}", headers=headers, **kwargs) as resp:
+                if resp.status >= 500:
+                    raise FlutterwaveError(f"Flutterwave HTTP {resp.status}")
+                return await resp.json()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise FlutterwaveError(str(e) or type(e).__name__) from e
+
+
+class FlutterwaveProvider(PaymentProvider):
+    name = "flutterwave"
+    label = "Flutterwave"
+
+    @property
+    def configured(self) -> bool:
+        return bool(FLW_SECRET_KEY)
+
+    async def _initialize(self, reference, amount_kobo, telegram_id, quantity, callback_url):
+        res = await self.breaker.call(_flw_request, "POST", "/payments", json={
+            "tx_ref": reference,
+            "amount": amount_kobo / 100,  # Flutterwave takes major units
+            "currency": CURRENCY,
+            "redirect_url": callback_url,
+            "customer": {"email": f"user_{telegram_id}@megawinraffle.com"},
+            "meta": {"telegram_id": telegram_id, "quantity": quantity},
+        })
+        if res.get("status") == "success":
+            return (res.get("data") or {}).get("link")
+        return None
+
+    async def _verify(self, reference):
+        res = await self.breaker.call(
+            _flw_request, "GET", "/transactions/verify_by_reference", params={"tx_ref": reference},
+        )
+        data = res.get("data") or {}
+        if res.get("status") == "success" and data.get("status") == "successful" \
+                and data.get("currency", CURRENCY) == CURRENCY:
+            return round(float(data.get("amount") or 0) * 100)
+        return None
+
+
+class ProviderRouter:
+    """Picks the healthiest configured provider for each checkout and fails over."""
+
+    def __init__(self, providers: list[PaymentProvider]):
+        self.providers = {p.name: p for p in providers}
+
+    def get(self, name: str) -> PaymentProvider | None:
+        return self.providers.get(name)
+
+    def ranked(self) -> list[PaymentProvider]:
+        """Configured providers whose breaker isn't open, best score first."""
+        usable = [p for p in self.providers.values() if p.configured and p.breaker.state != "open"]
+        return sorted(usable, key=lambda p: p.score(), reverse=True)
+
+    @property
+    def available(self) -> bool:
+        return bool(self.ranked())
+
+    async def initialize(self, reference: str, amount_kobo: int, telegram_id: int,
+                         quantity: int, callback_url: str | None) -> tuple[PaymentProvider, str]:
+        """(provider, checkout url) from the first provider that works; raises ProviderError if none does."""
+        last_error: Exception = ProviderError("no payment provider available")
+        for provider in self.ranked():
+            try:
+                url = await provider.initialize(reference, amount_kobo, telegram_id, quantity, callback_url)
+                return provider, url
+            except ProviderError as e:
+                logger.warning("%s initialize failed, trying next provider: %s", provider.label, e)
+                last_error = e
+        raise last_error
+
+
+router = ProviderRouter([
+    PaystackProvider(paystack.breaker),
+    FlutterwaveProvider(flutterwave_breaker),
+])
+
+
+class VerificationQueue:
+    """
+    Webhooks that arrive while their provider can't be reached are stored in
+    deferred_verifications and verified here once its breaker lets calls through.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.on_verified: Callable[[int, str, int, str], Awaitable] | None = None
+
+    async def defer(self, telegram_id: int, reference: str, provider: str = "paystack"):
+        async with async_session() as s:
+            exists = await s.scalar(
+                select(DeferredVerification.id).where(DeferredVerification.reference == reference)
+            )
+            if not exists:
+                s.add(DeferredVerification(reference=reference, telegram_id=int(telegram_id),
+                                           provider=provider))
+                await s.commit()
+
+    def start(self, on_verified: Callable[[int, str, int, str], Awaitable]):
+        """on_verified(telegram_id, reference, amount_kobo, provider) credits a confirmed payment."""
+        self.on_verified = on_verified
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(VERIFY_RETRY_POLL)
+            try:
+                await self.retry_due()
+            except Exception as e:
+                logger.error("Deferred verification pass failed: %s", e)
+
+    async def retry_due(self, limit: int = 20):
+        now = datetime.datetime.utcnow()
+        async with async_session() as s:
+            rows = (await s.execute(
+                select(DeferredVerification)
+                .where(DeferredVerification.status == "pending",
+                       DeferredVerification.next_attempt_at <= now)
+                .order_by(DeferredVerification.id)
+                .limit(limit)
+            )).scalars().all()
+
+            for row in rows:
+                provider = router.get(row.provider)
+                if provider is None:
+                    row.status = "failed"
+                    continue
+                if provider.breaker.state == "open":
+                    continue
+                try:
+                    amount = await provider.verify(row.reference)
+                except ProviderError:
+                    row.attempts += 1
+                    row.next_attempt_at = now + datetime.timedelta(seconds=min(30 * 2 ** row.attempts, 3600))
+                    if row.attempts >= VERIFY_MAX_ATTEMPTS:
+                        row.status = "failed"
+                        logger.error("Gave up verifying %s reference %s", provider.label, row.reference)
+                    continue
+
+                if amount is None:
+                    row.status = "failed"
+                    logger.warning("Deferred %s reference %s did not verify", provider.label, row.reference)
+                else:
+                    await self.on_verified(row.telegram_id, row.reference, amount, row.provider)
+                    row.status = "done"
+            await s.commit()
+
+
+verification_queue = VerificationQueue()
@@ -0,0 +1,103 @@
+# app/rollups.py
+import datetime
+from collections import defaultdict
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app.database import HourlyStats, User, Payment, RaffleEntry, ArchivedEntry
+
+COUNTERS = tuple(c.name for c in HourlyStats.__table__.columns if c.name != "hour")
+
+
+def hour_of(t: datetime.datetime | None = None) -> datetime.datetime:
+    return (t or datetime.datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+
+
+def _dialect(session) -> str:
+    return session.bind.dialect.name
+
+
+async def bump(session, at: datetime.datetime | None = None, **deltas: int):
+    """
+    Add `deltas` to the counters of the hour containing `at` (default now),
+    as one upsert inside the caller's transaction, so a rollup moves exactly
+    when the event it counts commits.
+    """
+    insert = postgresql.insert if _dialect(session) == "postgresql" else sqlite.insert
+    stmt = insert(HourlyStats).values(hour=hour_of(at), **deltas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["hour"],
+        set_={k: getattr(HourlyStats, k) + stmt.excluded[k] for k in deltas},
+    )
+    await session.execute(stmt)
+
+
+async def series(session, since: datetime.datetime, until: datetime.datetime | None = None) -> list[dict]:
+    """Hourly rows in [since, until), oldest first; hours with no activity are absent."""
+    q = select(*HourlyStats.__table__.columns).where(HourlyStats.hour >= hour_of(since))
+    if until is not None:
+        q = q.where(HourlyStats.hour < until)
+    rows = (await session.execute(q.order_by(HourlyStats.hour))).mappings().all()
+    return [dict(r) for r in rows]
+
+
+async def totals(session) -> dict:
+    """All-time sums of every counter (one row per hour, so a few thousand rows a year)."""
+    row = (await session.execute(select(*(func.coalesce(func.sum(getattr(HourlyStats, k)), 0)
+                                          for k in COUNTERS)))).one()
+    return dict(zip(COUNTERS, row))
+
+
+async def backfill(session) -> int:
+    """
+    First deploy only: if hourly_stats is empty, rebuild it from the raw
+    tables with one GROUP BY pass each. Returns the number of hours written
+    (0 when the rollups already exist or another worker got there first).
+    """
+    if await session.scalar(select(HourlyStats.hour).limit(1)) is not None:
+        return 0
+
+    if _dialect(session) == "postgresql":
+        def hour(col):
+            return func.date_trunc("hour", col)
+    else:
+        def hour(col):
+            return func.strftime("%Y-%m-%d %H:00:00", col)
+
+    hours: dict[datetime.datetime, dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    async def collect(col, names, *aggregates, where=None):
+        h = hour(col)
+        q = select(h, *aggregates).where(col.isnot(None))
+        if where is not None:
+            q = q.where(where)
+        for bucket, *values in (await session.execute(q.group_by(h))).all():
+            if isinstance(bucket, str):
+                bucket = datetime.datetime.fromisoformat(bucket)
+            for name, v in zip(names, values):
+                hours[bucket][name] += v or 0
+
+    await collect(Payment.created_at, ["checkouts"], func.count(Payment.id))
+    await collect(Payment.paid_at, ["payments", "tickets_paid", "revenue_kobo"],
+                  func.count(Payment.id), func.sum(Payment.quantity), func.sum(Payment.amount),
+                  where=Payment.status == "success")
+    for table in (RaffleEntry, ArchivedEntry):
+        await collect(table.created_at, ["tickets_free"], func.count(table.id), where=table.free_ticket == True)
+    await collect(User.created_at, ["new_users"], func.count(User.id))
+    await collect(User.first_paid_at, ["first_payers"], func.count(User.id))
+    # when a referral was credited isn't stored; the referred user's signup hour is the closest
+    await collect(User.created_at, ["referred_users"], func.count(User.id), where=User.referred_by.isnot(None))
+    await collect(User.first_paid_at, ["referred_payers"], func.count(User.id),
+                  where=User.referred_by.isnot(None))
+
+    if not hours:
+        return 0
+    session.add_all(HourlyStats(hour=h, **counts) for h, counts in hours.items())
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        return 0
+    return len(hours)
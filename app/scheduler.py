@@ -0,0 +1,259 @@
+# app/scheduler.py
+import os
+import socket
+import asyncio
+import logging
+import secrets
+import datetime
+from typing import Awaitable, Callable
+
+from sqlalchemy import select, update, func, or_, and_
+
+from app import jsoncodec
+from app.database import async_session, ScheduledJob
+
+SCHEDULER_POLL = float(os.getenv("SCHEDULER_POLL", "15"))     # seconds between idle polls
+JOB_LEASE = float(os.getenv("JOB_LEASE", "120"))              # seconds a claim lasts without a heartbeat
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """Another instance took over the job (our lease expired)."""
+
+
+class Job:
+    """What a handler gets: the job's payload and a way to checkpoint it."""
+
+    def __init__(self, scheduler: "JobScheduler", row: ScheduledJob):
+        self.scheduler = scheduler
+        self.id = row.id
+        self.kind = row.kind
+        self.payload: dict = jsoncodec.loads(row.payload or "{}")
+
+    async def checkpoint(self, session=None):
+        """
+        Save the payload and renew the lease. Pass the session holding the
+        step's own writes to commit both together; raises LeaseLost (and
+        rolls back) if this instance no longer owns the job.
+        """
+        if session is None:
+            async with async_session() as s:
+                return await self.checkpoint(s)
+        res = await session.execute(
+            update(ScheduledJob)
+            .where(ScheduledJob.id == self.id, ScheduledJob.locked_by == self.scheduler.instance)
+            .values(payload=jsoncodec.dumps(self.payload), locked_until=_lease_end())
+        )
+        if res.rowcount != 1:
+            await session.rollback()
+            raise LeaseLost(f"job {self.id}")
+        await session.commit()
+
+
+def _lease_end() -> datetime.datetime:
+    return datetime.datetime.utcnow() + datetime.timedelta(seconds=JOB_LEASE)
+
+
+class JobScheduler:
+    """
+    Runs jobs stored in scheduled_jobs. Every worker polls, but a job only
+    runs where the conditional UPDATE that claims its lease succeeds, and a
+    running job renews the lease; if its worker dies, the lease lapses and
+    another worker resumes it from the last checkpoint.
+    """
+
+    def __init__(self):
+        self.instance = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self.handlers: dict[str, Callable[[Job], Awaitable]] = {}
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        # earliest run_at of an unfinished close_raffle job (datetime.min once
+        # one has started), refreshed every poll
+        self.next_close: datetime.datetime | None = None
+        self._next_due: datetime.datetime | None = None
+
+    @property
+    def sales_closed(self) -> bool:
+        """True from a close job's run_at until it has finished (no DB hit)."""
+        return self.next_close is not None and datetime.datetime.utcnow() >= self.next_close
+
+    def register(self, kind: str, handler: Callable[[Job], Awaitable]):
+        self.handlers[kind] = handler
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def schedule(self, kind: str, run_at: datetime.datetime, payload: dict | None = None) -> int:
+        async with async_session() as s:
+            job = ScheduledJob(kind=kind, run_at=run_at, payload=jsoncodec.dumps(payload or {}))
+            s.add(job)
+            await s.commit()
+        await self.refresh()
+        self._wake.set()
+        return job.id
+
+    async def cancel(self, job_id: int) -> bool:
+        """Cancel a job that hasn't started yet."""
+        async with async_session() as s:
+            res = await s.execute(
+                update(ScheduledJob)
+                .where(ScheduledJob.id == job_id, ScheduledJob.status == "pending",
+                       ScheduledJob.attempts == 0)
+                .values(status="cancelled", finished_at=datetime.datetime.utcnow())
+            )
+            await s.commit()
+        await self.refresh()
+        return res.rowcount == 1
+
+    async def upcoming(self, limit: int = 10) -> list[ScheduledJob]:
+        async with async_session() as s:
+            q = await s.execute(
+                select(ScheduledJob)
+                .where(ScheduledJob.status.in_(("pending", "running")))
+                .order_by(ScheduledJob.run_at)
+                .limit(limit)
+            )
+            return q.scalars().all()
+
+    async def refresh(self):
+        async with async_session() as s:
+            unfinished = ScheduledJob.status.in_(("pending", "running"))
+            closes = (await s.execute(
+                select(ScheduledJob.run_at, ScheduledJob.status, ScheduledJob.attempts)
+                .where(unfinished, ScheduledJob.kind == "close_raffle")
+            )).all()
+            # a close that has started stays "closed" through its retries (run_at moves forward)
+            self.next_close = min(
+                (datetime.datetime.min if status == "running" or attempts else run_at
+                 for run_at, status, attempts in closes),
+                default=None,
+            )
+            # next pending run_at, or the moment a running job's lease lapses
+            due, lapse = (await s.execute(select(
+                func.min(ScheduledJob.run_at).filter(ScheduledJob.status == "pending"),
+                func.min(ScheduledJob.locked_until).filter(ScheduledJob.status == "running"),
+            ))).one()
+            self._next_due = min((t for t in (due, lapse) if t is not None), default=None)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+                await self.run_due()
+            except Exception as e:
+                logger.error("Scheduler pass failed: %s", e)
+            timeout = SCHEDULER_POLL
+            if self._next_due is not None:
+                until = (self._next_due - datetime.datetime.utcnow()).total_seconds()
+                timeout = min(timeout, max(until, 0.5))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _claim(self, job_id: int, now: datetime.datetime) -> ScheduledJob | None:
+        async with async_session() as s:
+            res = await s.execute(
+                update(ScheduledJob)
+                .where(
+                    ScheduledJob.id == job_id,
+                    or_(
+                        and_(ScheduledJob.status == "pending", ScheduledJob.run_at <= now),
+                        and_(ScheduledJob.status == "running", ScheduledJob.locked_until < now),
+                    ),
+                )
+                .values(status="running", locked_by=self.instance, locked_until=_lease_end())
+            )
+            await s.commit()
+            if res.rowcount != 1:
+                return None  # not due any more, or another instance got it first
+            return await s.get(ScheduledJob, job_id, populate_existing=True)
+
+    async def run_due(self) -> int:
+        """Claim and run due jobs (plus ones whose worker died); returns how many ran here."""
+        now = datetime.datetime.utcnow()
+        async with async_session() as s:
+            ids = (await s.execute(
+                select(ScheduledJob.id)
+                .where(or_(
+                    and_(ScheduledJob.status == "pending", ScheduledJob.run_at <= now),
+                    and_(ScheduledJob.status == "running", ScheduledJob.locked_until < now),
+                ))
+                .order_by(ScheduledJob.run_at)
+                .limit(10)
+            )).scalars().all()
+
+        ran = 0
+        for job_id in ids:
+            row = await self._claim(job_id, now)
+            if row is None:
+                continue
+            await self._execute(row)
+            ran += 1
+        if ran:
+            await self.refresh()
+        return ran
+
+    async def _heartbeat(self, job_id: int):
+        while True:
+            await asyncio.sleep(JOB_LEASE / 3)
+            async with async_session() as s:
+                await s.execute(
+                    update(ScheduledJob)
+                    .where(ScheduledJob.id == job_id, ScheduledJob.locked_by == self.instance)
+                    .values(locked_until=_lease_end())
+                )
+                await s.commit()
+
+    async def _execute(self, row: ScheduledJob):
+        job = Job(self, row)
+        handler = self.handlers.get(row.kind)
+        beat = asyncio.create_task(self._heartbeat(row.id))
+        values = {"locked_by": None, "locked_until": None}
+        try:
+            if handler is None:
+                raise RuntimeError(f"no handler for job kind {row.kind!r}")
+            await handler(job)
+            values.update(status="done", finished_at=datetime.datetime.utcnow(),
+                          payload=jsoncodec.dumps(job.payload))
+            logger.info("Job %s (%s) done", row.id, row.kind)
+        except LeaseLost:
+            logger.warning("Job %s was taken over by another instance", row.id)
+            return
+        except Exception as e:
+            attempts = row.attempts + 1
+            values.update(attempts=attempts, last_error=str(e)[:255])
+            if attempts >= JOB_MAX_ATTEMPTS:
+                values.update(status="failed", finished_at=datetime.datetime.utcnow())
+                logger.error("Job %s (%s) failed for good: %s", row.id, row.kind, e)
+            else:
+                delay = min(30 * 2 ** attempts, 3600)
+                values.update(status="pending",
+                              run_at=datetime.datetime.utcnow() + datetime.timedelta(seconds=delay))
+                logger.warning("Job %s (%s) failed, retrying in %ss: %s", row.id, row.kind, delay, e)
+        finally:
+            beat.cancel()
+
+        async with async_session() as s:
+            await s.execute(
+                update(ScheduledJob)
+                .where(ScheduledJob.id == row.id, ScheduledJob.locked_by == self.instance)
+                .values(**values)
+            )
+            await s.commit()
+
+
+scheduler = JobScheduler()
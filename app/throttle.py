@@ -0,0 +1,164 @@
+# app/throttle.py
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Update
+
+from app.utils import spawn
+
+# per-user limit across everything the user sends
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "1"))      # tokens / second
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "5"))
+# identical callback taps within this window are dropped
+CALLBACK_DEBOUNCE = float(os.getenv("CALLBACK_DEBOUNCE", "1.0"))  # seconds
+
+# (rate, burst) per command / callback prefix; anything else uses DEFAULT_COMMAND_LIMIT
+COMMAND_LIMITS = {
+    "buy": (0.2, 2),
+    "buy_ticket": (0.2, 2),
+    "buy_qty": (0.2, 2),
+    "start": (0.5, 3),
+}
+DEFAULT_COMMAND_LIMIT = (0.5, 3)
+
+
+class TokenBuckets:
+    """
+    Token buckets keyed by anything hashable.
+    Keys live in an OrderedDict in last-used order, so expiring idle buckets
+    and evicting the oldest one when full are both O(1) per call.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000, idle_ttl: float = 600.0):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl
+        self._buckets: OrderedDict[Any, list] = OrderedDict()  # key -> [tokens, last_seen]
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allow(self, key, now: float | None = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+        buckets = self._buckets
+
+        # the front of the dict is always the least recently used bucket
+        while buckets:
+            oldest = next(iter(buckets.values()))
+            if now - oldest[1] < self.idle_ttl:
+                break
+            buckets.popitem(last=False)
+
+        b = buckets.get(key)
+        if b is None:
+            if len(buckets) >= self.max_keys:
+                buckets.popitem(last=False)
+            b = buckets[key] = [self.burst, now]
+        else:
+            b[0] = min(self.burst, b[0] + (now - b[1]) * self.rate)
+            b[1] = now
+            buckets.move_to_end(key)
+
+        if b[0] >= 1:
+            b[0] -= 1
+            return True
+        return False
+
+
+def _classify(update: Update) -> tuple[int, str, str | None] | None:
+    """(user_id, command, callback_data) for updates we throttle, else None."""
+    if update.message and update.message.from_user:
+        text = update.message.text or ""
+        if text.startswith("/"):
+            command = text[1:].split(maxsplit=1)[0].split("@", 1)[0].lower()
+        else:
+            command = ""
+        return update.message.from_user.id, command, None
+    if update.callback_query:
+        data = update.callback_query.data or ""
+        return update.callback_query.from_user.id, data.split(":", 1)[0], data
+    return None
+
+
+async def _answer(callback: CallbackQuery, text: str | None):
+    await callback.answer(text)
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    """Outer update middleware: drops updates from users who exceed their buckets."""
+
+    def __init__(self, exempt: set[int] | None = None):
+        self.exempt = exempt or set()
+        self.per_user = TokenBuckets(THROTTLE_RATE, THROTTLE_BURST)
+        self.per_command = {
+            name: TokenBuckets(rate, burst) for name, (rate, burst) in COMMAND_LIMITS.items()
+        }
+        self.default_command = TokenBuckets(*DEFAULT_COMMAND_LIMIT)
+        # capacity 1 refilled once per window == debounce
+        self.debounce = TokenBuckets(1.0 / CALLBACK_DEBOUNCE, 1)
+        self.stats = Counter()
+
+    def check(self, user_id: int, command: str, callback_data: str | None, now: float | None = None) -> str | None:
+        """Return the reason an update should be dropped, or None to let it through."""
+        if now is None:
+            now = time.monotonic()
+        if callback_data is not None and not self.debounce.allow((user_id, callback_data), now):
+            return "debounce"
+        if not self.per_user.allow(user_id, now):
+            return "user"
+        if command:
+            buckets = self.per_command.get(command, self.default_command)
+            if not buckets.allow((user_id, command), now):
+                return "command"
+        return None
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        key = _classify(event)
+        if key is None or key[0] in self.exempt:
+            return await handler(event, data)
+
+        reason = self.check(*key)
+        if reason:
+            self.stats[f"dropped_{reason}"] += 1
+            if event.callback_query:
+                # stop the button's spinner, or the user taps again; a double tap needs no text
+                text = None if reason == "debounce" else "⏳ Slow down a little…"
+                spawn(_answer(event.callback_query, text), name="throttle-answer")
+            return None
+        self.stats["passed"] += 1
+        return await handler(event, data)
+
+
+class RecentIds:
+    """Fixed-size ring of recently seen ids with O(1) membership checks."""
+
+    def __init__(self, size: int = 4096):
+        self._ring = deque(maxlen=size)
+        self._seen: set = set()
+
+    def __contains__(self, item):
+        return item in self._seen
+
+    def add(self, item) -> bool:
+        """Remember item; False if it was already in the ring."""
+        if item in self._seen:
+            return False
+        if len(self._ring) == self._ring.maxlen:
+            self._seen.discard(self._ring[0])
+        self._ring.append(item)
+        self._seen.add(item)
+        return True
+
+    def discard(self, item):
+        # leaves a stale slot in the ring; it ages out like any other
+        self._seen.discard(item)
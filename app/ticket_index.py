@@ -0,0 +1,118 @@
+# app/ticket_index.py
+import os
+import random
+from array import array
+
+from sqlalchemy import select, func
+
+from app.database import RaffleEntry
+
+# Set TICKET_INDEX=1 to keep every ticket in memory for instant draws / counts.
+# Each worker only adds the tickets it credits itself, so with several workers
+# the index is checked against the DB (COUNT / MAX(id)) and reloaded before a draw.
+TICKET_INDEX_ENABLED = os.getenv("TICKET_INDEX", "0") == "1"
+LOAD_CHUNK = 50_000
+
+
+class TicketIndex:
+    """
+    Compact in-process copy of raffle_entries (paid and free tickets, both are
+    in the draw): ticket ids and owner ids in parallel array('q')s, plus
+    per-user counts in an array indexed by users.id.
+    ~16 bytes per ticket, so 10M tickets take ~160 MB.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.ticket_ids = array("q")
+        self.owner_ids = array("q")
+        self.user_counts = array("i")
+        self.free_count = 0
+        self.max_id = 0
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.ticket_ids)
+
+    def add(self, ticket_id: int, user_id: int, free: bool = False):
+        self.extend([ticket_id], [user_id], int(free))
+
+    def add_many(self, ticket_ids, user_id: int, free: bool = False):
+        ticket_ids = list(ticket_ids)
+        self.extend(ticket_ids, [user_id] * len(ticket_ids), len(ticket_ids) if free else 0)
+
+    def extend(self, ticket_ids, user_ids, free_count: int = 0):
+        """Append parallel lists of ticket ids / owner ids."""
+        if not ticket_ids:
+            return
+        self.ticket_ids.extend(ticket_ids)
+        self.max_id = max(self.max_id, max(ticket_ids))
+        self.owner_ids.extend(user_ids)
+        counts = self.user_counts
+        top = max(user_ids)
+        if top >= len(counts):
+            counts.extend(array("i", bytes(4 * (top + 1 - len(counts)))))
+        for uid in user_ids:
+            counts[uid] += 1
+        self.free_count += free_count
+
+    def count_for_user(self, user_id: int) -> int:
+        return self.user_counts[user_id] if 0 <= user_id < len(self.user_counts) else 0
+
+    def draw(self) -> tuple[int, int] | None:
+        """Random (ticket_id, user_id), or None if there are no tickets."""
+        if not self.ticket_ids:
+            return None
+        i = random.randrange(len(self.ticket_ids))
+        return self.ticket_ids[i], self.owner_ids[i]
+
+    async def load(self, session, chunk: int = LOAD_CHUNK):
+        """Rebuild from the DB, streaming the table by primary key in chunks."""
+        self.clear()
+        last_id = 0
+        while True:
+            q = await session.execute(
+                select(RaffleEntry.id, RaffleEntry.user_id, RaffleEntry.free_ticket)
+                .where(RaffleEntry.id > last_id)
+                .order_by(RaffleEntry.id)
+                .limit(chunk)
+            )
+            rows = q.all()
+            if not rows:
+                break
+            self.extend(
+                [r[0] for r in rows],
+                [r[1] for r in rows],
+                sum(1 for r in rows if r[2]),
+            )
+            last_id = rows[-1][0]
+        self.loaded = True
+
+    async def sync(self, session) -> bool:
+        """
+        Reload if the DB's ticket count or highest id differs from ours (tickets
+        credited or archived by another worker). Returns True if it reloaded.
+        """
+        total, max_id = (await session.execute(
+            select(func.count(RaffleEntry.id), func.coalesce(func.max(RaffleEntry.id), 0))
+        )).one()
+        if (total, max_id) == (len(self), self.max_id):
+            return False
+        await self.load(session)
+        return True
+
+    async def verify(self, session) -> bool:
+        """Compare ticket count, free count and id checksum against the DB."""
+        total, id_sum, free = (await session.execute(
+            select(
+                func.count(RaffleEntry.id),
+                func.coalesce(func.sum(RaffleEntry.id), 0),
+                func.count(RaffleEntry.id).filter(RaffleEntry.free_ticket == True),
+            )
+        )).one()
+        return (total, id_sum, free) == (len(self), sum(self.ticket_ids), self.free_count)
+
+
+ticket_index = TicketIndex()
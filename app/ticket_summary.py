@@ -0,0 +1,102 @@
+# app/ticket_summary.py
+import os
+import time
+import datetime
+from collections import OrderedDict
+from typing import NamedTuple
+
+from sqlalchemy import select, func
+
+from app.database import User, RaffleEntry
+from app.ticket_index import ticket_index
+
+TICKET_SUMMARY_TTL = float(os.getenv("TICKET_SUMMARY_TTL", "300"))  # seconds
+TICKET_SUMMARY_MAX = int(os.getenv("TICKET_SUMMARY_MAX", "50000"))  # users kept
+# the raffle-wide ticket count behind the odds; shared by everyone, so a short TTL is cheap
+TICKET_TOTAL_TTL = float(os.getenv("TICKET_TOTAL_TTL", "30"))
+
+
+class TicketSummary(NamedTuple):
+    paid: int
+    free: int
+    latest_id: int | None
+    latest_at: datetime.datetime | None
+
+    @property
+    def tickets(self) -> int:
+        return self.paid + self.free
+
+
+class TicketSummaryCache:
+    """
+    Per-user ticket summaries for the current raffle, by telegram_id.
+    Entries live for TICKET_SUMMARY_TTL and are dropped early when the user's
+    tickets change on this worker (payment credited, referral award, raffle
+    closed); the TTL bounds staleness for changes made on other workers.
+    """
+
+    def __init__(self):
+        self._entries: OrderedDict[int, tuple[float, TicketSummary | None]] = OrderedDict()
+        self._total: tuple[float, int] | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self, telegram_id: int):
+        self._entries.pop(int(telegram_id), None)
+        self._total = None
+
+    def clear(self):
+        self._entries.clear()
+        self._total = None
+
+    async def get(self, session, telegram_id: int) -> TicketSummary | None:
+        """The user's summary, or None for someone who has never used the bot."""
+        now = time.monotonic()
+        cached = self._entries.get(telegram_id)
+        if cached and cached[0] > now:
+            self._entries.move_to_end(telegram_id)
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        row = (await session.execute(
+            select(
+                func.count(RaffleEntry.id).filter(RaffleEntry.free_ticket == False),
+                func.count(RaffleEntry.id).filter(RaffleEntry.free_ticket == True),
+                func.max(RaffleEntry.id),
+                func.max(RaffleEntry.created_at),
+            )
+            .select_from(User)
+            .outerjoin(RaffleEntry, RaffleEntry.user_id == User.id)
+            .where(User.telegram_id == telegram_id)
+            .group_by(User.id)
+        )).one_or_none()
+        summary = TicketSummary(*row) if row else None
+
+        if len(self._entries) >= TICKET_SUMMARY_MAX:
+            self._entries.popitem(last=False)
+        self._entries[telegram_id] = (now + TICKET_SUMMARY_TTL, summary)
+        return summary
+
+    async def total(self, session) -> int:
+        """Tickets in the current raffle (ticket index if loaded, else a cached COUNT)."""
+        if ticket_index.loaded:
+            return len(ticket_index)
+        now = time.monotonic()
+        if self._total is None or self._total[0] <= now:
+            n = await session.scalar(select(func.count(RaffleEntry.id))) or 0
+            self._total = (now + TICKET_TOTAL_TTL, n)
+        return self._total[1]
+
+
+def render(summary: TicketSummary, total: int) -> str:
+    lines = [f"🎟 <b>Your tickets:</b> {summary.tickets} ({summary.paid} paid, {summary.free} free)"]
+    if summary.latest_id:
+        when = f" on {summary.latest_at:%Y-%m-%d %H:%M}" if summary.latest_at else ""
+        lines.append(f"🆕 Latest: #{summary.latest_id}{when}")
+    if summary.tickets and total:
+        lines.append(f"🎯 Odds: {summary.tickets} of {total:,} tickets ({summary.tickets / total:.2%})")
+    return "\n".join(lines)
+
+
+ticket_summaries = TicketSummaryCache()
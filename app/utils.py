@@ -1,5 +1,7 @@
 # app/utils.py
-import os, secrets
+import os, hmac, asyncio, logging, secrets
+
+logger = logging.getLogger(__name__)
 
 TICKET_PRICE = int(float(os.getenv("TICKET_PRICE", "500")))
 
@@ -9,3 +11,23 @@ def kobo(amount_ngn: int) -> int:
 
 def generate_reference(prefix="RAFF"):
     return f"{prefix}_{secrets.token_hex(8)}"
+
+def admin_token_ok(authorization: str | None) -> bool:
+    """Check an `Authorization: Bearer ...` header against ADMIN_API_TOKEN (unset = deny)."""
+    token = os.getenv("ADMIN_API_TOKEN")
+    return bool(token) and hmac.compare_digest((authorization or "").encode(), f"Bearer {token}".encode())
+
+# fire-and-forget tasks; the event loop only keeps weak references to tasks
+_background: set[asyncio.Task] = set()
+
+def spawn(coro, name: str | None = None) -> asyncio.Task:
+    """asyncio.create_task that holds the task until it finishes and logs it if it fails."""
+    task = asyncio.create_task(coro, name=name)
+    _background.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+def _background_done(task: asyncio.Task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task %s failed", task.get_name(), exc_info=task.exception())
@@ -4,7 +4,8 @@ from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from .db import get_db
 from .models import User, Payment, Entry, Raffle
-import os, json, hmac, hashlib
+from . import jsoncodec
+import os, hmac, hashlib
 
 router = APIRouter()
 
@@ -18,7 +19,7 @@ async def paystack_webhook(request: Request, db: Session = Depends(get_db)):
         if not hmac.compare_digest(sig or "", digest):
             raise HTTPException(status_code=401, detail="Invalid signature")
 
-    payload = await request.json()
+    payload = jsoncodec.loads(body)
     event = payload.get("event")
     data = payload.get("data", {})
 
@@ -51,7 +52,7 @@ async def paystack_webhook(request: Request, db: Session = Depends(get_db)):
             amount=amount,
             currency=currency,
             status="success",
-            raw=json.dumps(payload),
+            raw=jsoncodec.dumps(payload),
             user_id=user.id if user else None
         )
         db.add(payment)
@@ -76,7 +77,8 @@ async def paystack_webhook(request: Request, db: Session = Depends(get_db)):
 
 @router.post("/flutterwave/webhook")
 async def flutterwave_webhook(request: Request, db: Session = Depends(get_db)):
-    payload = await request.json()
+    body = await request.body()
+    payload = jsoncodec.loads(body)
     data = payload.get("data") or payload
     status = data.get("status")
     if status in ("successful", "success"):
@@ -108,7 +110,7 @@ async def flutterwave_webhook(request: Request, db: Session = Depends(get_db)):
             amount=amount,
             currency=currency,
             status="success",
-            raw=json.dumps(payload),
+            raw=jsoncodec.dumps(payload),
             user_id=user.id if user else None
         )
         db.add(payment)
@@ -1,6 +1,9 @@
 from fastapi import FastAPI
 
+from app.dashboard import router as dashboard_router
+
 app = FastAPI()
+app.include_router(dashboard_router)
 
 @app.get("/")
 async def root():
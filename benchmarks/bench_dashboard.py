@@ -0,0 +1,81 @@
+# benchmarks/bench_dashboard.py
+"""
+Dashboard reads over a year of payments: the hourly_stats rollup vs the
+GROUP BY over raw payments it replaces, plus what the rollup costs per payment.
+
+    python -m benchmarks.bench_dashboard [n_payments]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import sqlite3
+import datetime
+import tempfile
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_dashboard.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_PATH}"
+
+from sqlalchemy import select, func  # noqa: E402
+
+from app.database import init_db, async_session, Payment  # noqa: E402
+from app import rollups  # noqa: E402
+
+
+async def main(n: int = 2_000_000):
+    await init_db()
+    rnd = random.Random(1)
+    start = datetime.datetime.utcnow() - datetime.timedelta(days=365)
+    con = sqlite3.connect(DB_PATH)
+    con.executemany(
+        "INSERT INTO payments (id, user_id, provider, reference, quantity, amount, status, created_at, paid_at) "
+        "VALUES (?, ?, 'paystack', ?, ?, ?, 'success', ?, ?)",
+        ((i + 1, i % 50_000 + 1, f"R{i}", q, 50_000 * q, t, t) for i in range(n)
+         for q in [rnd.randint(1, 5)] for t in [start + datetime.timedelta(seconds=i * 365 * 86400 // n)]),
+    )
+    con.execute("CREATE INDEX ix_bench_paid_at ON payments (paid_at)")  # give the raw query its best shot
+    con.commit()
+    con.close()
+
+    async with async_session() as s:
+        t0 = time.perf_counter()
+        hours = await rollups.backfill(s)
+        print(f"{n:,} payments; one-time backfill -> {hours:,} hourly rows in {time.perf_counter() - t0:.2f}s")
+
+    since = rollups.hour_of() - datetime.timedelta(days=30)
+    async with async_session() as s:
+        reps = 200
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            rows = await rollups.series(s, since)
+        per = (time.perf_counter() - t0) / reps
+        print(f"30-day series from rollup     {per * 1000:9.2f} ms  ({len(rows)} rows)")
+
+        hour = func.strftime("%Y-%m-%d %H:00:00", Payment.paid_at)
+        raw = (select(hour, func.count(Payment.id), func.sum(Payment.quantity), func.sum(Payment.amount))
+               .where(Payment.status == "success", Payment.paid_at >= since).group_by(hour))
+        t0 = time.perf_counter()
+        for _ in range(5):
+            rows = (await s.execute(raw)).all()
+        print(f"30-day GROUP BY over payments {(time.perf_counter() - t0) / 5 * 1000:9.2f} ms  ({len(rows)} rows)")
+
+        t0 = time.perf_counter()
+        all_time = await rollups.totals(s)
+        print(f"all-time totals from rollup   {(time.perf_counter() - t0) * 1000:9.2f} ms  "
+              f"({all_time['payments']:,} payments)")
+        t0 = time.perf_counter()
+        await s.execute(select(func.count(Payment.id), func.sum(Payment.amount)).where(Payment.status == "success"))
+        print(f"all-time totals over payments {(time.perf_counter() - t0) * 1000:9.2f} ms")
+
+        # write side: one upsert per payment, inside its transaction
+        k = 2000
+        t0 = time.perf_counter()
+        for _ in range(k):
+            await rollups.bump(s, payments=1, tickets_paid=2, revenue_kobo=100_000)
+        await s.commit()
+        print(f"rollup upsert per payment     {(time.perf_counter() - t0) / k * 1e6:9.1f} µs")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000))
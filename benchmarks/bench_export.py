@@ -0,0 +1,65 @@
+# benchmarks/bench_export.py
+"""
+Throughput and peak memory of the streaming ledger export.
+
+    python -m benchmarks.bench_export [n_tickets]
+
+Seeds a throwaway SQLite file (default 1M tickets; pass 10000000 for the
+full-size run) and streams it through iter_export without keeping output.
+"""
+import os
+import sys
+import time
+import asyncio
+import sqlite3
+import tempfile
+import tracemalloc
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_export.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_PATH}"
+
+from app.database import init_db  # noqa: E402  (after DATABASE_URL is set)
+from app.export import iter_export  # noqa: E402
+
+
+def seed(n: int, users: int = 100_000):
+    con = sqlite3.connect(DB_PATH)
+    con.executemany(
+        "INSERT INTO users (id, telegram_id, username, referral_count, created_at) VALUES (?, ?, ?, 0, '2025-01-01 00:00:00')",
+        ((i, 10_000_000 + i, f"user{i}") for i in range(1, users + 1)),
+    )
+    con.executemany(
+        "INSERT INTO raffle_entries (id, user_id, payment_ref, free_ticket, created_at) VALUES (?, ?, ?, 0, '2025-01-01 00:00:00')",
+        ((i, i % users + 1, f"RAFF_{i:016x}") for i in range(1, n + 1)),
+    )
+    con.commit()
+    con.close()
+
+
+async def main(n: int = 1_000_000):
+    await init_db()
+    t0 = time.perf_counter()
+    seed(n)
+    print(f"seeded {n:,} tickets in {time.perf_counter() - t0:.1f}s")
+
+    for fmt in ("csv", "ndjson"):
+        t0 = time.perf_counter()
+        size = await drain(fmt)
+        elapsed = time.perf_counter() - t0
+        # second pass under tracemalloc (slows it down a lot) just for the peak
+        tracemalloc.start()
+        await drain(fmt)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{fmt:7s} {size / 2**20:8.0f} MB out, {n / elapsed:10,.0f} rows/s, "
+              f"peak {peak / 2**20:.1f} MB")
+
+
+async def drain(fmt: str) -> int:
+    size = 0
+    async for chunk in iter_export("entries", fmt):
+        size += len(chunk)
+    return size
+
+if __name__ == "__main__":
+    asyncio.run(main(*(int(a) for a in sys.argv[1:2])))
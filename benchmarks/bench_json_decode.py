@@ -0,0 +1,57 @@
+# benchmarks/bench_json_decode.py
+"""
+Decode cost per Telegram update: old path vs the one telegram_webhook uses now.
+
+    BOT_TOKEN=1:x python -m benchmarks.bench_json_decode
+"""
+import json
+import timeit
+
+from aiogram import types
+
+from app import jsoncodec
+from app.bot import bot
+
+RAW = json.dumps({
+    "update_id": 100000001,
+    "message": {
+        "message_id": 42,
+        "date": 1700000000,
+        "chat": {"id": 123456789, "type": "private", "first_name": "Ada", "username": "ada"},
+        "from": {"id": 123456789, "is_bot": False, "first_name": "Ada", "username": "ada",
+                 "language_code": "en"},
+        "text": "/buy 5",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 4}],
+    },
+}).encode()
+UNHANDLED = json.dumps({
+    "update_id": 100000002,
+    "my_chat_member": {"chat": {"id": 1, "type": "private"}, "date": 1700000000},
+}).encode()
+KEYS = (b'"message"', b'"callback_query"')
+
+
+def old():
+    update = types.Update.model_validate(json.loads(RAW))
+    # feed_update re-validates updates that aren't bound to the bot
+    types.Update.model_validate(update.model_dump(), context={"bot": bot})
+
+
+def new():
+    types.Update.model_validate_json(RAW, context={"bot": bot})
+
+
+def dropped():
+    jsoncodec.mentions_any(UNHANDLED, KEYS)
+
+
+def main(n: int = 20_000):
+    for name, fn in (("json.loads + model_validate + rebind", old),
+                     ("model_validate_json w/ context", new),
+                     ("unhandled type pre-check", dropped)):
+        t = timeit.timeit(fn, number=n) / n
+        print(f"{name:40s} {t * 1e6:8.2f} µs/update")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# benchmarks/bench_leaderboard.py
+"""
+Rank lookups over 1M users: ReferralRanking vs an indexed COUNT(*) query.
+
+    python -m benchmarks.bench_leaderboard [n_users]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import sqlite3
+import tempfile
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_leaderboard.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_PATH}"
+
+from sqlalchemy import select, func  # noqa: E402
+
+from app.database import init_db, async_session, User  # noqa: E402
+from app.leaderboard import ReferralRanking  # noqa: E402
+
+
+async def main(n: int = 1_000_000):
+    await init_db()
+    rnd = random.Random(1)
+    # long tail: most users refer nobody, a few refer hundreds
+    totals = [int(rnd.paretovariate(1.2)) - 1 for _ in range(n)]
+    con = sqlite3.connect(DB_PATH)
+    con.executemany(
+        "INSERT INTO users (id, telegram_id, referral_count, referral_total) VALUES (?, ?, 0, ?)",
+        ((i + 1, 10_000_000 + i, t) for i, t in enumerate(totals)),
+    )
+    con.commit()
+    con.close()
+
+    ranking = ReferralRanking()
+    async with async_session() as s:
+        t0 = time.perf_counter()
+        await ranking.load(s)
+        print(f"{n:,} users, {ranking.ranked:,} ranked; load {time.perf_counter() - t0:.2f}s")
+
+        probes = [t for t in rnd.sample(totals, 2000) if t > 0] or [1]
+        k = 100_000
+        t0 = time.perf_counter()
+        for i in range(k):
+            ranking.rank(probes[i % len(probes)])
+        print(f"ReferralRanking.rank   {(time.perf_counter() - t0) / k * 1e6:10.2f} µs/lookup")
+
+        t0 = time.perf_counter()
+        for t in probes[:200]:
+            await s.scalar(select(func.count(User.id)).where(User.referral_total > t))
+        print(f"indexed COUNT(*) query {(time.perf_counter() - t0) / 200 * 1e6:10.2f} µs/lookup")
+
+        t0 = time.perf_counter()
+        for i in range(k):
+            ranking.bump(probes[i % len(probes)], probes[i % len(probes)] + 1)
+        print(f"ReferralRanking.bump   {(time.perf_counter() - t0) / k * 1e6:10.2f} µs/update")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*(int(a) for a in sys.argv[1:2])))
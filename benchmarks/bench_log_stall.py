@@ -0,0 +1,78 @@
+# benchmarks/bench_log_stall.py
+"""
+Event-loop stall during a log storm when stdout is slow (a full pipe or a
+busy log shipper), before and after moving writes to a QueueListener thread.
+A ticker coroutine asks for a 1 ms sleep and records how late it wakes.
+
+    python -m benchmarks.bench_log_stall
+"""
+import asyncio
+import logging
+import statistics
+import time
+
+from app import logconfig
+
+RECORDS = 2_000
+WRITE_DELAY = 0.0005  # seconds per write() on the slow stream
+
+
+class SlowStream:
+    def write(self, s):
+        time.sleep(WRITE_DELAY)  # blocking, like a write to a full pipe
+
+    def flush(self):
+        pass
+
+
+async def ticker(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - t - 0.001)
+
+
+async def storm(log: logging.Logger):
+    for i in range(RECORDS):
+        log.info("📩 Paystack event: %s ref=%s", "charge.success", f"RAFF_{i:08x}")
+        if i % 20 == 0:
+            await asyncio.sleep(0)  # a handler yielding between webhook calls
+
+
+async def run(name: str):
+    lags: list[float] = []
+    stop = asyncio.Event()
+    t = asyncio.create_task(ticker(lags, stop))
+    t0 = time.perf_counter()
+    await storm(logging.getLogger("bench"))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await t
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99)] if lags else 0
+    print(f"{name:26s} storm {elapsed * 1000:7.1f} ms   loop lag p50 {statistics.median(lags) * 1000:6.2f} ms"
+          f"   p99 {p99 * 1000:6.2f} ms   max {lags[-1] * 1000:6.2f} ms")
+
+
+def main():
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+
+    # before: logging.basicConfig -> StreamHandler writing on the loop thread
+    direct = logging.StreamHandler(SlowStream())
+    direct.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s - %(message)s"))
+    root.addHandler(direct)
+    asyncio.run(run("direct StreamHandler"))
+    root.removeHandler(direct)
+
+    # after: queue handler on the loop, formatting + writes on the listener thread
+    logconfig.setup_logging(SlowStream())
+    asyncio.run(run("QueueHandler + listener"))
+    t0 = time.perf_counter()
+    logconfig.stop_logging()
+    print(f"listener drained backlog in {(time.perf_counter() - t0) * 1000:.0f} ms, "
+          f"dropped {logconfig.dropped_records()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# benchmarks/bench_throttle.py
+"""
+Per-update overhead of ThrottleMiddleware.check().
+
+    python -m benchmarks.bench_throttle
+"""
+import random
+import time
+
+from app.throttle import ThrottleMiddleware
+
+
+def main(n: int = 500_000, users: int = 50_000):
+    mw = ThrottleMiddleware()
+    commands = ["start", "buy", "ticket", "referrals", ""]
+    rnd = random.Random(1)
+    events = [
+        (rnd.randrange(users), rnd.choice(commands), rnd.choice([None, None, "view_tickets"]))
+        for _ in range(n)
+    ]
+
+    t0 = time.perf_counter()
+    now = 0.0
+    for user_id, command, cb in events:
+        now += 0.0001
+        mw.check(user_id, command, cb, now)
+    elapsed = time.perf_counter() - t0
+
+    print(f"{n} updates, {users} users: {elapsed / n * 1e6:.2f} µs/update")
+    print(f"tracked buckets: user={len(mw.per_user)} debounce={len(mw.debounce)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# benchmarks/bench_ticket_index.py
+"""
+Memory and speed of TicketIndex at raffle scale.
+
+    python -m benchmarks.bench_ticket_index [n_tickets] [n_users]
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+from app.ticket_index import TicketIndex
+
+
+def main(n: int = 10_000_000, users: int = 1_000_000):
+    rnd = random.Random(1)
+    tracemalloc.start()
+    idx = TicketIndex()
+    t0 = time.perf_counter()
+    chunk = 50_000  # same shape as TicketIndex.load()
+    for start in range(1, n + 1, chunk):
+        ids = list(range(start, min(start + chunk, n + 1)))
+        idx.extend(ids, [rnd.randrange(1, users + 1) for _ in ids], len(ids) // 50)
+    build = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    t0 = time.perf_counter()
+    for _ in range(100_000):
+        idx.draw()
+    draw = (time.perf_counter() - t0) / 100_000
+
+    print(f"{n} tickets / {users} users: built in {build:.1f}s (incl. generating owners, under tracemalloc)")
+    print(f"memory: {current / 2**20:.0f} MB resident, {peak / 2**20:.0f} MB peak")
+    print(f"draw: {draw * 1e6:.2f} µs")
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,63 @@
+# benchmarks/bench_webhook_shedding.py
+"""
+How many junk requests/sec /webhook/telegram can turn away, driven through
+the ASGI app directly (no network, no uvicorn).
+
+    BOT_TOKEN=1:x python -m benchmarks.bench_webhook_shedding
+"""
+import asyncio
+import json
+import time
+
+from app.bot import app, TELEGRAM_WEBHOOK_PATH, TELEGRAM_WEBHOOK_SECRET
+
+JUNK = json.dumps({"update_id": 1, "message": {"text": "x" * 500}}).encode()
+
+
+async def call(headers: list[tuple[bytes, bytes]], body: bytes) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "https", "path": TELEGRAM_WEBHOOK_PATH,
+        "raw_path": TELEGRAM_WEBHOOK_PATH.encode(), "query_string": b"",
+        "root_path": "", "headers": headers, "server": ("bench", 443), "client": ("1.2.3.4", 1),
+    }
+    sent = False
+    status = 0
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(msg):
+        nonlocal status
+        if msg["type"] == "http.response.start":
+            status = msg["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def flood(name: str, headers, body: bytes, n: int = 20_000):
+    await call(headers, body)  # warm-up (and first sighting of the update_id)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        status = await call(headers, body)
+    rate = n / (time.perf_counter() - t0)
+    print(f"{name:28s} -> {status}  {rate:10,.0f} req/s")
+
+
+async def main():
+    length = [(b"content-length", str(len(JUNK)).encode())]
+    secret = [(b"x-telegram-bot-api-secret-token", TELEGRAM_WEBHOOK_SECRET.encode())]
+    await flood("no secret header", length, JUNK)
+    await flood("wrong secret", length + [(b"x-telegram-bot-api-secret-token", b"nope")], JUNK)
+    big = b"x" * 300_000
+    await flood("oversized body", secret + [(b"content-length", str(len(big)).encode())], big)
+    await flood("replayed update_id", secret + length, JUNK)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,174 @@
+# benchmarks/conftest.py
+"""
+Fixtures for the handler benchmarks: a throwaway SQLite file seeded to each
+size in BENCH_SIZES, and a Bot whose session answers locally.
+
+    python -m pytest benchmarks -q -s
+    BENCH_SIZES=1000,100000,1000000 python -m pytest benchmarks -q -s
+"""
+import os
+import sys
+import asyncio
+import datetime
+import tempfile
+
+_DB = os.path.join(tempfile.mkdtemp(prefix="raffle-bench-"), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_DB}"
+os.environ.setdefault("BOT_TOKEN", "42:bench")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("PAYSTACK_SECRET_KEY", "sk_bench")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LEADERBOARD_TTL", "3600")  # no periodic reload inside a measured run
+os.environ.pop("PUBLIC_URL", None)
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe, SendMessage
+from aiogram.types import Chat, Message, User as TgUser
+from sqlalchemy import event, insert, select, func
+
+BENCH_SIZES = sorted(int(n) for n in os.getenv("BENCH_SIZES", "1000,20000").split(","))
+BENCH_OPS = int(os.getenv("BENCH_OPS", "100"))
+TICKETS_PER_USER = 10
+BOT_ID = 42
+FIRST_TG_ID = 1_000_000  # seeded users are telegram_id FIRST_TG_ID + users.id
+
+
+class LocalSession(BaseSession):
+    """Bot session that answers every API call in-process and counts them."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def make_request(self, bot: Bot, method, timeout=None):
+        self.calls += 1
+        if isinstance(method, GetMe):
+            return TgUser(id=BOT_ID, is_bot=True, first_name="Bench", username="bench_bot")
+        if isinstance(method, SendMessage):
+            return Message(message_id=self.calls, date=datetime.datetime.now(),
+                           chat=Chat(id=method.chat_id, type="private"), text=method.text)
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def app_bot(loop):
+    """app.bot with a local Bot session, no throttling and a fake Paystack."""
+    import app.bot as bot_module
+    from app import paystack
+    from app.database import engine, init_db
+
+    bot_module.bot.session = LocalSession()
+    bot_module.throttle.check = lambda *a, **k: None
+
+    async def fake_initialize(payload):
+        return {"status": True, "data": {"authorization_url": f"https://pay.local/{payload['reference']}"}}
+    paystack.initialize_transaction = fake_initialize
+
+    loop.run_until_complete(init_db())
+    bot_module.queries = QueryCounter(engine)
+    return bot_module
+
+
+@pytest.fixture
+def fresh_db(loop, monkeypatch):
+    """
+    An empty DB of the test's own, for flows that would disturb the seeded
+    one (close-outs empty raffle_entries); yields its session factory.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from app import database
+
+    path = os.path.join(tempfile.mkdtemp(prefix="raffle-test-"), "fresh.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    shared = database.async_session
+    for name, module in list(sys.modules.items()):
+        if name.startswith("app.") and getattr(module, "async_session", None) is shared:
+            monkeypatch.setattr(module, "async_session", session)
+    monkeypatch.setattr(database, "engine", engine)
+    loop.run_until_complete(database.init_db())
+    yield session
+    loop.run_until_complete(engine.dispose())
+
+
+async def seed_to(size: int):
+    """Grow the DB to `size` tickets (TICKETS_PER_USER per user, every 10th user has paid once)."""
+    from app.database import async_session, User, RaffleEntry, Payment
+    from app.leaderboard import referral_ranking
+
+    async with async_session() as s:
+        have = await s.scalar(select(func.count(RaffleEntry.id)))
+        users = await s.scalar(select(func.count(User.id)))
+        chunk = 50_000
+        now = datetime.datetime.utcnow()
+        for start in range(have, size, chunk):
+            stop = min(start + chunk, size)
+            need_users = -(-stop // TICKETS_PER_USER)
+            if need_users > users:
+                await s.execute(insert(User), [
+                    {"id": uid, "telegram_id": FIRST_TG_ID + uid, "username": f"tg{FIRST_TG_ID + uid}",
+                     "referral_count": 0, "referral_total": uid % 7, "created_at": now}
+                    for uid in range(users + 1, need_users + 1)
+                ])
+                await s.execute(insert(Payment), [
+                    {"user_id": uid, "reference": f"seed-{uid}", "quantity": TICKETS_PER_USER,
+                     "amount": 50_000 * TICKETS_PER_USER, "status": "success", "created_at": now}
+                    for uid in range(users + 1, need_users + 1) if uid % 10 == 0
+                ])
+                users = need_users
+            await s.execute(insert(RaffleEntry), [
+                {"user_id": i // TICKETS_PER_USER + 1, "payment_ref": f"seed-{i}",
+                 "free_ticket": i % 50 == 0, "created_at": now}
+                for i in range(start, stop)
+            ])
+            await s.commit()
+        await referral_ranking.load(s)
+    return users
+
+
+# handler -> {size: (ops/sec, SQL statements per op)}
+RESULTS: dict[str, dict[int, tuple[float, float]]] = {}
+
+
+@pytest.fixture(scope="session")
+def bench_results():
+    return RESULTS
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not RESULTS:
+        return
+    sizes = sorted({size for runs in RESULTS.values() for size in runs})
+    tr = terminalreporter
+    tr.section("handler benchmarks (ops/s, SQL/op)")
+    tr.write_line(f"{'handler':22s}" + "".join(f"{n:>24,}" for n in sizes))
+    for name, runs in RESULTS.items():
+        cells = "".join(
+            f"{runs[n][0]:>14,.0f} {runs[n][1]:>6.1f} SQL" if n in runs else f"{'-':>24s}" for n in sizes
+        )
+        tr.write_line(f"{name:22s}{cells}")
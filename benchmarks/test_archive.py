@@ -0,0 +1,40 @@
+# benchmarks/test_archive.py
+"""Raffle close-out: archiving, drawing and ticket numbering across raffles."""
+from sqlalchemy import select
+
+from app.archive import close_raffle, draw_winner
+from app.database import User, RaffleEntry, ArchivedEntry
+
+
+async def buy(session, user_id: int, refs: list[str]):
+    session.add_all(RaffleEntry(user_id=user_id, payment_ref=r) for r in refs)
+    await session.commit()
+
+
+def test_close_two_raffles_in_a_row(loop, fresh_db):
+    async def scenario():
+        async with fresh_db() as s:
+            user = User(telegram_id=1)
+            s.add(user)
+            await s.flush()
+            await buy(s, user.id, ["a1", "a2", "a3"])
+        first = await close_raffle("first")
+
+        # the hot table is empty now; the next ticket must not reuse #1
+        async with fresh_db() as s:
+            await buy(s, user.id, ["b1"])
+            assert await s.scalar(select(RaffleEntry.id)) == 4
+        second = await close_raffle("second")
+
+        assert (first.status, first.ticket_count) == ("archived", 3)
+        assert (second.status, second.ticket_count) == ("archived", 1)
+        async with fresh_db() as s:
+            archived = (await s.execute(
+                select(ArchivedEntry.raffle_id, ArchivedEntry.ticket_id).order_by(ArchivedEntry.id)
+            )).all()
+        assert archived == [(first.id, 1), (first.id, 2), (first.id, 3), (second.id, 4)]
+
+        assert (await draw_winner(second.id)).winner_ticket_id == 4
+        assert await close_raffle("third") is None
+
+    loop.run_until_complete(scenario())
@@ -0,0 +1,103 @@
+# benchmarks/test_handlers.py
+"""
+Every handler in app/bot.py driven through dp.feed_update against a DB seeded
+to each of BENCH_SIZES tickets (see conftest.py). Reports ops/s and SQL
+statements per call, and fails if a handler's statement count grows with
+the size of the tables.
+"""
+import time
+import itertools
+
+import pytest
+from aiogram.types import Update
+
+from conftest import BENCH_SIZES, BENCH_OPS, BOT_ID, FIRST_TG_ID, seed_to
+
+ADMIN_TG_ID = 1
+_update_ids = itertools.count(1)
+_new_users = itertools.count(5_000_000)
+
+
+def _message(tg_id: int, text: str) -> dict:
+    return {"message_id": next(_update_ids), "date": 1_700_000_000, "text": text,
+            "chat": {"id": tg_id, "type": "private"},
+            "from": {"id": tg_id, "is_bot": False, "first_name": "u", "username": f"tg{tg_id}"}}
+
+
+def msg(tg_id: int, text: str) -> dict:
+    return {"update_id": next(_update_ids), "message": _message(tg_id, text)}
+
+
+def callback(tg_id: int, data: str) -> dict:
+    # callbacks come from buttons on a message the bot sent
+    shown = _message(tg_id, "menu")
+    shown["from"] = {"id": BOT_ID, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+    return {"update_id": next(_update_ids), "callback_query": {
+        "id": str(next(_update_ids)), "chat_instance": "bench", "data": data, "message": shown,
+        "from": {"id": tg_id, "is_bot": False, "first_name": "u", "username": f"tg{tg_id}"}}}
+
+
+def inline(tg_id: int) -> dict:
+    return {"update_id": next(_update_ids), "inline_query": {
+        "id": str(next(_update_ids)), "query": "", "offset": "",
+        "from": {"id": tg_id, "is_bot": False, "first_name": "u", "username": f"tg{tg_id}"}}}
+
+
+def seeded(i: int, users: int) -> int:
+    # newest users first, so each size runs against users earlier runs haven't touched
+    return FIRST_TG_ID + users - i % users
+
+
+# name -> (i, seeded user count) -> update
+HANDLERS = {
+    "cmd_start (referral)": lambda i, n: msg(next(_new_users), f"/start {seeded(i, n)}"),
+    "cmd_buy": lambda i, n: msg(seeded(i, n), "/buy 2"),
+    "cmd_ticket": lambda i, n: msg(seeded(i, n), "/ticket"),
+    "cmd_referrals": lambda i, n: msg(seeded(i, n), "/referrals"),
+    "cmd_leaderboard": lambda i, n: msg(seeded(i, n), "/leaderboard"),
+    "cmd_winners": lambda i, n: msg(ADMIN_TG_ID, "/winners"),
+    "cmd_stats": lambda i, n: msg(ADMIN_TG_ID, "/stats"),
+    "cb_buy": lambda i, n: callback(seeded(i, n), "buy_ticket"),
+    "cb_buy_qty": lambda i, n: callback(seeded(i, n), "buy_qty:5"),
+    "cb_tickets": lambda i, n: callback(seeded(i, n), "view_tickets"),
+    "cb_ref": lambda i, n: callback(seeded(i, n), "my_referrals"),
+    "cb_help": lambda i, n: callback(seeded(i, n), "help_cmd"),
+    "inline_my_tickets": lambda i, n: inline(seeded(i, n)),
+}
+
+
+async def measure(b, make, users: int, ops: int = BENCH_OPS) -> tuple[float, float]:
+    updates = [Update.model_validate(make(i, users), context={"bot": b.bot}) for i in range(ops + 5)]
+    for u in updates[:5]:  # warm-up: first-call caches, statement compilation
+        b._pay_links.clear()
+        b.ticket_summaries.clear()
+        await b.dp.feed_update(b.bot, u)
+
+    calls, queries = b.bot.session.calls, b.queries.count
+    elapsed = 0.0
+    for u in updates[5:]:
+        b._pay_links.clear()  # every /buy starts a fresh checkout
+        b.ticket_summaries.clear()  # and every ticket view is a cold read, at any size
+        t0 = time.perf_counter()
+        await b.dp.feed_update(b.bot, u)
+        elapsed += time.perf_counter() - t0
+    assert b.bot.session.calls - calls >= ops, "handler didn't answer every update"
+    return ops / elapsed, (b.queries.count - queries) / ops
+
+
+@pytest.mark.parametrize("size", BENCH_SIZES)
+def test_handlers(size, app_bot, loop, bench_results):
+    users = loop.run_until_complete(seed_to(size))
+    for name, make in HANDLERS.items():
+        bench_results.setdefault(name, {})[size] = loop.run_until_complete(measure(app_bot, make, users))
+
+
+@pytest.mark.parametrize("name", list(HANDLERS))
+def test_query_count_does_not_grow(name, bench_results):
+    runs = bench_results.get(name, {})
+    if len(runs) < 2:
+        pytest.skip("needs at least two BENCH_SIZES")
+    small, large = min(runs), max(runs)
+    assert runs[large][1] <= runs[small][1], (
+        f"{name}: {runs[small][1]:.2f} SQL/op at {small:,} tickets, {runs[large][1]:.2f} at {large:,}"
+    )
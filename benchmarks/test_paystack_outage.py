@@ -0,0 +1,135 @@
+# benchmarks/test_paystack_outage.py
+"""
+The Paystack client against a local fake Paystack that injects latency and
+errors: the circuit breaker opens, refuses calls without waiting, closes on
+one half-open probe, and a webhook deferred during the outage gets credited.
+
+    python -m pytest benchmarks/test_paystack_outage.py -q
+"""
+import time
+import asyncio
+
+import pytest
+from aiohttp import web
+from sqlalchemy import select
+
+from app import paystack
+from app.providers import verification_queue
+from app.database import init_db, async_session, DeferredVerification
+
+FAILURES = 3       # consecutive failures that open the breaker
+SLOW_CALL = 0.5    # seconds; slower calls count as failures
+RESET = 0.5        # seconds open before the half-open probe
+
+
+class FakePaystack:
+    """Answers like Paystack; `mode` is "ok", "slow" (3s) or "error" (HTTP 503)."""
+
+    def __init__(self):
+        self.mode = "ok"
+        self.calls = 0
+        self.runner: web.AppRunner | None = None
+        self.released: asyncio.Event | None = None  # set to let a "slow" request finish early
+
+    async def handle(self, request: web.Request):
+        self.calls += 1
+        if self.mode == "slow":
+            try:
+                await asyncio.wait_for(self.released.wait(), 3)
+            except asyncio.TimeoutError:
+                pass
+        if self.mode == "error":
+            return web.json_response({"status": False}, status=503)
+        return web.json_response({"status": True, "data": {"status": "success", "amount": 50000}})
+
+    async def start(self) -> str:
+        self.released = asyncio.Event()
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", 0).start()
+        host, port = self.runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def timed(reference: str = "R") -> tuple[str, float]:
+    """Outcome of one verify call ("ok" | "refused" | "failed") and its duration."""
+    t0 = time.perf_counter()
+    try:
+        await paystack.verify_transaction(reference)
+        outcome = "ok"
+    except paystack.CircuitOpenError:
+        outcome = "refused"
+    except paystack.PaystackError:
+        outcome = "failed"
+    return outcome, time.perf_counter() - t0
+
+
+@pytest.fixture
+def fake_paystack(loop, monkeypatch):
+    fake = FakePaystack()
+    monkeypatch.setattr(paystack, "PAYSTACK_API_URL", loop.run_until_complete(fake.start()))
+    monkeypatch.setattr(paystack, "PAYSTACK_TIMEOUT", 1.0)
+    breaker = paystack.breaker
+    for name, value in (("failure_threshold", FAILURES), ("slow_call", SLOW_CALL), ("reset_timeout", RESET),
+                        ("failures", 0), ("opened_at", None)):
+        monkeypatch.setattr(breaker, name, value)
+    loop.run_until_complete(init_db())
+    yield fake
+    loop.run_until_complete(fake.stop())
+
+
+def test_breaker_through_outage(loop, fake_paystack, monkeypatch):
+    breaker = paystack.breaker
+    credited = []
+
+    async def on_verified(tg_id, reference, amount, provider):
+        credited.append((tg_id, reference, amount))
+
+    monkeypatch.setattr(verification_queue, "on_verified", on_verified, raising=False)
+
+    async def scenario():
+        assert (await timed())[0] == "ok"
+
+        # a timeout and then HTTP errors, FAILURES in a row, open the breaker
+        fake_paystack.mode = "slow"
+        assert (await timed())[0] == "failed"
+        assert breaker.state == "closed"
+        fake_paystack.released.set()  # client gave up; don't leave the request hanging
+        fake_paystack.mode = "error"
+        for _ in range(FAILURES - 1):
+            assert (await timed())[0] == "failed"
+        assert breaker.state == "open"
+
+        # while open, calls are refused without touching Paystack
+        calls = fake_paystack.calls
+        outcome, seconds = await timed()
+        assert outcome == "refused"
+        assert seconds < 0.01
+        assert fake_paystack.calls == calls
+
+        # a webhook arriving now is deferred instead of waiting on Paystack
+        await verification_queue.defer(42, "REF-DURING-OUTAGE")
+
+        # Paystack recovers: after RESET one probe goes through and closes the breaker
+        fake_paystack.mode = "ok"
+        await asyncio.sleep(RESET + 0.05)
+        assert breaker.state == "half_open"
+        probe, other = await asyncio.gather(timed(), timed())
+        assert (probe[0], other[0]) == ("ok", "refused")  # only the probe is let through
+        assert breaker.state == "closed"
+        assert fake_paystack.calls == calls + 1
+
+        await verification_queue.retry_due()
+        async with async_session() as s:
+            row = (await s.execute(
+                select(DeferredVerification).where(DeferredVerification.reference == "REF-DURING-OUTAGE")
+            )).scalar_one()
+        assert row.status == "done"
+        assert credited == [(42, "REF-DURING-OUTAGE", 50000)]
+
+    loop.run_until_complete(scenario())
@@ -0,0 +1,56 @@
+# benchmarks/test_scheduler.py
+"""Scheduled close_raffle jobs run through JobScheduler against a throwaway DB."""
+import datetime
+
+from sqlalchemy import select
+
+from app.database import User, RaffleEntry, ArchivedRaffle, ScheduledJob, OutboxMessage
+from app.scheduler import JobScheduler
+
+
+async def buy(session, user_id: int, refs: list[str]):
+    session.add_all(RaffleEntry(user_id=user_id, payment_ref=r) for r in refs)
+    await session.commit()
+
+
+async def run_close(sched: JobScheduler, db, title: str) -> ScheduledJob:
+    job_id = await sched.schedule("close_raffle", datetime.datetime.utcnow(), {"title": title})
+    assert await sched.run_due() == 1
+    async with db() as s:
+        return await s.get(ScheduledJob, job_id)
+
+
+def test_two_close_jobs_back_to_back(app_bot, loop, fresh_db):
+    sched = JobScheduler()
+    sched.register("close_raffle", app_bot.run_close_job)
+
+    async def scenario():
+        async with fresh_db() as s:
+            alice, bob = User(telegram_id=10, username="alice"), User(telegram_id=11, username="bob")
+            s.add_all([alice, bob])
+            await s.flush()
+            await buy(s, alice.id, ["a1", "a2"])
+            await buy(s, bob.id, ["b1"])
+        first = await run_close(sched, fresh_db, "first")
+
+        async with fresh_db() as s:
+            await buy(s, bob.id, ["b2"])
+        second = await run_close(sched, fresh_db, "second")
+
+        assert (first.status, second.status) == ("done", "done")
+        assert not sched.sales_closed
+        async with fresh_db() as s:
+            raffles = (await s.execute(select(ArchivedRaffle).order_by(ArchivedRaffle.id))).scalars().all()
+            messages = (await s.execute(
+                select(OutboxMessage.chat_id, OutboxMessage.text).order_by(OutboxMessage.id)
+            )).all()
+        assert [(r.title, r.status, r.ticket_count) for r in raffles] == \
+            [("first", "archived", 3), ("second", "archived", 1)]
+        assert (raffles[1].winner_ticket_id, raffles[1].winner_user_id) == (4, bob.id)
+
+        # results for both raffles were queued: every holder, then the admin summary
+        admin = app_bot.ADMIN_ID
+        assert [chat for chat, _ in messages] == [10, 11, admin, 11, admin]
+        assert "won <b>second</b>" in messages[3][1] and "#4" in messages[3][1]
+
+    loop.run_until_complete(scenario())